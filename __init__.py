@@ -16,3 +16,8 @@ class DemoPlugin(EditBookToolPlugin):
     supported_platforms = ['windows', 'osx', 'linux']
     description = 'A simple EpubCheck 4.2.6 wrapper.'
     minimum_calibre_version = (5, 13, 0)
+
+    def cli_main(self, argv):
+        # headless mode: calibre-debug -r EpubCheck -- [options] files/folders
+        from calibre_plugins.epub_check.batch import main
+        return main(argv[1:])
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+'''
+Headless EPUBCheck runner for whole folders or calibre libraries.
+
+    calibre-debug -r EpubCheck -- [options] book.epub ... /path/to/library
+    python batch.py [options] book.epub ... /path/to/library
+'''
+
+# standard libraries
+import os, sys, json, time, zipfile, argparse, tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from calibre_plugins.epub_check.checker import get_environment, streamingJarWrapper, build_args, MessageCollector
+    from calibre_plugins.epub_check.message_parser import parse_line, read_json_report, parse_json_report, make_name_to_href, MESSAGE_TYPES
+    from calibre_plugins.epub_check.profiles import get_profiles, get_profile, profile_options
+    from calibre_plugins.epub_check.faststart import get_tuning_args, fast_start_args, archive_is_current, create_archive
+except ImportError:
+    from checker import get_environment, streamingJarWrapper, build_args, MessageCollector
+    from message_parser import parse_line, read_json_report, parse_json_report, make_name_to_href, MESSAGE_TYPES
+    from profiles import get_profiles, get_profile, profile_options
+    from faststart import get_tuning_args, fast_start_args, archive_is_current, create_archive
+
+SEVERITIES = ('FATAL', 'ERROR', 'WARNING', 'INFO', 'USAGE')
+
+# get the calibre plugin preferences, if available
+def get_prefs():
+    try:
+        from calibre.utils.config import config_dir, JSONConfig
+    except ImportError:
+        return None, {}
+    return os.path.join(config_dir, 'plugins', 'EPUBCheck'), JSONConfig('plugins/EpubCheck')
+
+# find all epub files in the given files and folders
+def find_epubs(paths):
+    epubs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file_name in sorted(files):
+                    if file_name.lower().endswith('.epub'):
+                        epubs.append(os.path.join(root, file_name))
+        elif os.path.isfile(path):
+            epubs.append(path)
+        else:
+            print('File not found:', path)
+    return epubs
+
+# create a dictionary that maps names to relative hrefs
+def epub_name_to_href(epub_path):
+    try:
+        with zipfile.ZipFile(epub_path) as archive:
+            return make_name_to_href([href for href in archive.namelist() if not href.endswith('/')])
+    except (zipfile.BadZipfile, OSError):
+        return {}
+
+# check a single book
+def check_book(epub_path, jvm_args, epc_path, epc_args, usage=False, json_output=True, max_messages=10000, max_duplicates=10, message_filter=None):
+    start = time.time()
+    collector = MessageCollector(max_messages, max_duplicates)
+    name_to_href = epub_name_to_href(epub_path)
+    hrefs = set(name_to_href.values())
+    paths = {}
+
+    def run(args, parse_text):
+        # only the last lines of the regular output are kept
+        stdout_lines = deque(maxlen=500)
+        stderr_lines = deque(maxlen=500)
+
+        def process_line(line, output_lines, has_messages):
+            if has_messages and line.startswith(MESSAGE_TYPES):
+                if message_filter is not None and not message_filter.accepts(line):
+                    return
+                message = parse_line(line, name_to_href, hrefs, paths) if parse_text else None
+                if message is not None:
+                    collector.add(message)
+                if message is not None or not parse_text:
+                    return
+            output_lines.append(line)
+
+        # usage messages are written to stdout!
+        returncode = streamingJarWrapper(jvm_args + ['-jar', epc_path] + args,
+                                         lambda line: process_line(line, stdout_lines, usage),
+                                         lambda line: process_line(line, stderr_lines, True))
+        return returncode, '\n'.join(stdout_lines), '\n'.join(stderr_lines)
+
+    report = None
+    if json_output:
+        # ask EPUBCheck for a JSON report; large reports are read while they're parsed
+        fd, json_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            returncode, stdout, stderr = run(['--json', json_path] + epc_args + [epub_path], False)
+            report = read_json_report(json_path)
+            if report is not None and not (returncode == 1 and 'java.lang.' in stderr):
+                for message in parse_json_report(report, name_to_href, message_filter):
+                    collector.add(message)
+        finally:
+            os.remove(json_path)
+
+    # older EPUBCheck versions don't support --json
+    if not json_output or (report is None and returncode != 0):
+        report = None
+        returncode, stdout, stderr = run(epc_args + [epub_path], True)
+
+    book = {'path': epub_path, 'returncode': returncode, 'java_error': None,
+            'counts': dict((severity, 0) for severity in SEVERITIES), 'messages': []}
+
+    # check for Java errors
+    if returncode == 1 and 'java.lang.' in stderr:
+        book['java_error'] = stderr
+    else:
+        for message in collector.messages:
+            if message.severity in book['counts']:
+                book['counts'][message.severity] += message.count
+            book['messages'].append({'file': message.filepath, 'line': message.line, 'column': message.col,
+                                     'code': message.err_code, 'message': message.msg, 'count': message.count})
+    book['seconds'] = round(time.time() - start, 3)
+    return book
+
+# a book fails if Java failed, if EPUBCheck found errors or if it returned an error code
+def book_failed(book):
+    counts = book['counts']
+    return book['java_error'] is not None or bool(counts['FATAL'] or counts['ERROR']) or book['returncode'] != 0
+
+# one line summary of a checked book
+def book_summary(book):
+    counts = book['counts']
+    if book['java_error'] is not None:
+        status = 'JAVA'
+    elif book_failed(book):
+        status = 'FAIL'
+    else:
+        status = ' OK '
+    return '[{}] {} ({} fatal, {} errors, {} warnings, {:.1f} s)'.format(
+        status, book['path'], counts['FATAL'], counts['ERROR'], counts['WARNING'], book['seconds'])
+
+def main(argv=None):
+    epubcheck_dir, prefs = get_prefs()
+
+    parser = argparse.ArgumentParser(description='Check epub files or calibre libraries with EPUBCheck.')
+    parser.add_argument('paths', nargs='+', help='epub files and/or folders (e.g. a calibre library)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='number of parallel EPUBCheck runs (default: number of CPUs)')
+    parser.add_argument('--epubcheck-dir', default=epubcheck_dir, help='folder with epubcheck.jar and lib/')
+    parser.add_argument('--java', default=prefs.get('java_path', 'java'), help='path to the java binary')
+    parser.add_argument('--locale', default=prefs.get('locale', None), help='EPUBCheck message language')
+    parser.add_argument('--usage', action='store_true', default=prefs.get('usage', False), help='include USAGE messages')
+    parser.add_argument('--check-profile', default=prefs.get('check_profile', None),
+                        help='check profile: {}'.format(', '.join(profile['name'] for profile in get_profiles(prefs))))
+    parser.add_argument('--no-json', dest='json_output', action='store_false', help='parse the text output instead of the EPUBCheck JSON report')
+    parser.add_argument('--max-messages', type=int, default=prefs.get('max_messages', 10000), help='maximum number of messages stored per book')
+    parser.add_argument('--max-duplicates', type=int, default=prefs.get('max_duplicates', 10), help='identical messages stored before they are only counted')
+    parser.add_argument('--fast-start', action='store_true', default=prefs.get('fast_start', False), help='use an AppCDS archive and JVM options sized for each book')
+    parser.add_argument('--report', help='write a JSON report to this file')
+    args = parser.parse_args(argv)
+
+    if args.epubcheck_dir is None:
+        parser.error('--epubcheck-dir is required outside of calibre')
+    epc_path = os.path.join(args.epubcheck_dir, 'epubcheck.jar')
+    if not os.path.isfile(epc_path):
+        parser.error('epubcheck.jar not found in {}'.format(args.epubcheck_dir))
+
+    if args.check_profile and get_profile(prefs, args.check_profile).get('name') != args.check_profile:
+        parser.error('unknown check profile: {}'.format(args.check_profile))
+    try:
+        profile_args, usage, message_filter = profile_options(get_profile(prefs, args.check_profile), args.usage)
+    except ValueError as e:
+        parser.error(str(e))
+
+    env = get_environment(prefs, args.java, epc_path)
+    jvm_args, epc_args = build_args(args.java, env['is32bit'], args.locale)
+    epc_args += profile_args
+    epubs = find_epubs(args.paths)
+    print('Checking {} books with EPUBCheck {} ({} jobs)'.format(len(epubs), env['epc_version'], args.jobs))
+
+    # JVM options of each book
+    book_jvm_args = dict((epub_path, jvm_args) for epub_path in epubs)
+    if args.fast_start:
+        if not archive_is_current(env['java_version'], epc_path):
+            print('Creating AppCDS archive...')
+            create_archive(jvm_args + get_tuning_args(prefs, env, args.java), env['java_version'], epc_path)
+        for epub_path in epubs:
+            tuning = get_tuning_args(prefs, env, args.java, os.path.getsize(epub_path))
+            book_jvm_args[epub_path] = fast_start_args(jvm_args, tuning, env['java_version'], epc_path)
+
+    #--------------------------------------------
+    # check the books in parallel
+    #--------------------------------------------
+    start = time.time()
+    books = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(check_book, epub_path, book_jvm_args[epub_path], epc_path, epc_args, usage, args.json_output,
+                               args.max_messages, args.max_duplicates, message_filter) for epub_path in epubs]
+        for future in as_completed(futures):
+            book = future.result()
+            books.append(book)
+            print(book_summary(book))
+    elapsed = time.time() - start
+
+    #--------------------------------------------
+    # print totals and write the report
+    #--------------------------------------------
+    failed = [book for book in books if book_failed(book)]
+    books_per_minute = len(books) / elapsed * 60 if elapsed > 0 else 0.0
+    print('{} books checked, {} failed, {:.1f} s, {:.1f} books/min'.format(len(books), len(failed), elapsed, books_per_minute))
+
+    if args.report:
+        books.sort(key=lambda book: book['path'])
+        report = {
+            'epubcheck_version': env['epc_version'],
+            'books': books,
+            'failed': len(failed),
+            'seconds': round(elapsed, 3),
+            'books_per_minute': round(books_per_minute, 2),
+        }
+        with open(args.report, 'wb') as f:
+            f.write(json.dumps(report, indent=2).encode('utf-8'))
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
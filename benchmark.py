@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+'''
+Benchmark of the plugin's check pipeline, without the calibre GUI and, by default, without Java.
+
+    python benchmark.py [options]
+    calibre-debug benchmark.py -- [options]
+
+A synthetic corpus of books is generated and every stage of a check is timed: writing the
+epub, JVM startup, the EPUBCheck run, parsing its output and building the message list of
+the dock. A stand-in script replaces EPUBCheck unless --java and --epubcheck-dir are given.
+The results are written as JSON; --compare prints the changes against an earlier result.
+'''
+
+# standard libraries
+import os, re, sys, json, time, random, shutil, zipfile, argparse, platform, tempfile, subprocess
+
+try:
+    from calibre_plugins.epub_check.checker import get_epc_version, jarWrapper, streamingJarWrapper, build_args, MessageCollector
+    from calibre_plugins.epub_check.message_parser import parse_lines, read_json_report, parse_json_report, make_name_to_href
+except ImportError:
+    from checker import get_epc_version, jarWrapper, streamingJarWrapper, build_args, MessageCollector
+    from message_parser import parse_lines, read_json_report, parse_json_report, make_name_to_href
+
+# EPUBCheck stand-in; called like java: [-Dfake.startup=s] [-Dfake.rate=MB/s] -jar epubcheck.jar [options] book
+FAKE_EPUBCHECK = r'''
+import os, sys, json, time, zipfile
+
+args = sys.argv[1:]
+props = dict(arg[2:].split('=', 1) for arg in args if arg.startswith('-D') and '=' in arg)
+time.sleep(float(props.get('fake.startup', 0)))
+if '-version' in args:
+    sys.stderr.write('fake version "0"\n')
+    sys.exit(0)
+args = args[args.index('-jar') + 2:]
+json_path = None
+if '--json' in args:
+    json_path = args[args.index('--json') + 1]
+book = args[-1]
+
+# read the content documents
+documents = []
+if os.path.isdir(book):
+    for root, dirs, files in os.walk(book):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            documents.append((os.path.relpath(path, book).replace(os.sep, '/'), open(path, 'rb').read()))
+else:
+    with zipfile.ZipFile(book) as archive:
+        documents = [(name, archive.read(name)) for name in archive.namelist()]
+size = sum(len(data) for name, data in documents)
+time.sleep(size / 1024.0 / 1024.0 / float(props.get('fake.rate', 50)))
+
+# report the marked paragraphs
+markers = ((b'class="err"', 'ERROR', 'RSC-012', 'Fragment identifier is not defined.'),
+           (b'class="warn"', 'WARNING', 'CSS-008', 'An error occurred while parsing the CSS: Token illegal.'))
+messages = {}
+for name, data in documents:
+    if not name.endswith('.xhtml'):
+        continue
+    for line_number, line in enumerate(data.split(b'\n'), 1):
+        for marker, severity, message_id, message in markers:
+            col = line.find(marker)
+            if col != -1:
+                messages.setdefault((severity, message_id, message), []).append({'path': name, 'line': line_number, 'column': col + 1})
+if json_path is not None:
+    report = {'checker': {'path': book, 'nFatal': 0}, 'messages': [
+        {'ID': message_id, 'severity': severity, 'message': message, 'locations': locations}
+        for (severity, message_id, message), locations in messages.items()]}
+    with open(json_path, 'w') as f:
+        json.dump(report, f)
+else:
+    for (severity, message_id, message), locations in messages.items():
+        for location in locations:
+            sys.stderr.write('{}({}): {}/{}({},{}): {}\n'.format(severity, message_id, book, location['path'], location['line'], location['column'], message))
+sys.stdout.write('Check finished with {}\n'.format('errors' if messages else 'no errors or warnings'))
+sys.exit(1 if messages else 0)
+'''
+
+# the default corpus: (name, content documents, KB per document, share of paragraphs with messages)
+DEFAULT_CASES = (
+    ('small', 10, 20, 0.01),
+    ('medium', 100, 50, 0.05),
+    ('large', 500, 100, 0.01),
+    ('noisy', 100, 50, 0.5),
+)
+
+STAGES = ('commit', 'startup', 'epubcheck', 'parse', 'dock', 'total')
+
+# get the plugin version from __init__.py without importing calibre
+def plugin_version():
+    try:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '__init__.py'), 'rb') as f:
+            match = re.search(r'version = \((\d+), (\d+), (\d+)\)', f.read().decode('utf-8'))
+        return '.'.join(match.groups())
+    except (OSError, AttributeError):
+        return ''
+
+#--------------------------------------------
+# corpus generator
+#--------------------------------------------
+
+# write an unpacked synthetic EPUB 3 book; returns the number of marked paragraphs
+def generate_book(book_dir, files, file_size, error_density, seed=0):
+    rnd = random.Random(seed)
+    words = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do')
+    os.makedirs(os.path.join(book_dir, 'META-INF'))
+    os.makedirs(os.path.join(book_dir, 'OEBPS', 'Text'))
+    os.makedirs(os.path.join(book_dir, 'OEBPS', 'Styles'))
+
+    def write(name, text):
+        with open(os.path.join(book_dir, *name.split('/')), 'wb') as f:
+            f.write(text.encode('utf-8'))
+
+    write('mimetype', 'application/epub+zip')
+    write('META-INF/container.xml', '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+        '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>\n</container>\n')
+    write('OEBPS/Styles/style.css', 'p { margin: 0; text-indent: 1em }\n.err, .warn { color: inherit }\n')
+
+    names = ['ch{:04d}.xhtml'.format(i) for i in range(files)]
+    marked = 0
+    for name in names:
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<!DOCTYPE html>',
+                 '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>{}</title>'.format(name),
+                 '<link rel="stylesheet" type="text/css" href="../Styles/style.css"/></head><body>']
+        size = 0
+        while size < file_size * 1024:
+            text = ' '.join(rnd.choice(words) for i in range(30))
+            if rnd.random() < error_density:
+                marked += 1
+                line = '<p class="{}">{}</p>'.format('err' if rnd.random() < 0.5 else 'warn', text)
+            else:
+                line = '<p>{}</p>'.format(text)
+            lines.append(line)
+            size += len(line) + 1
+        lines.append('</body></html>')
+        write('OEBPS/Text/' + name, '\n'.join(lines) + '\n')
+
+    write('OEBPS/Text/nav.xhtml', '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"><head><title>Contents</title></head>\n'
+        '<body><nav epub:type="toc"><ol>\n' + ''.join('<li><a href="{0}">{0}</a></li>\n'.format(name) for name in names) +
+        '</ol></nav></body></html>\n')
+    write('OEBPS/content.opf', '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">\n'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="uid">urn:uuid:00000000-0000-4000-8000-{:012d}</dc:identifier>\n'
+        '<dc:title>Benchmark</dc:title><dc:language>en</dc:language><meta property="dcterms:modified">2023-01-01T00:00:00Z</meta></metadata>\n'
+        '<manifest>\n<item id="nav" href="Text/nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'
+        '<item id="css" href="Styles/style.css" media-type="text/css"/>\n'.format(seed) +
+        ''.join('<item id="c{0}" href="Text/{1}" media-type="application/xhtml+xml"/>\n'.format(i, name) for i, name in enumerate(names)) +
+        '</manifest>\n<spine>\n' + ''.join('<itemref idref="c{}"/>\n'.format(i) for i in range(files)) + '</spine>\n</package>\n')
+    return marked
+
+#--------------------------------------------
+# pipeline stages
+#--------------------------------------------
+
+# write the epub; with calibre, the book is written by a container like in the editor
+def commit_book(book_dir, epub_path):
+    try:
+        from calibre.ebooks.oeb.polish.container import get_container
+        from calibre.utils.logging import default_log
+    except ImportError:
+        get_container = None
+    if get_container is not None:
+        container = get_container(book_dir, default_log, tweak_mode=True)
+        container.commit(epub_path)
+        return 'calibre'
+    with zipfile.ZipFile(epub_path, 'w') as archive:
+        archive.write(os.path.join(book_dir, 'mimetype'), 'mimetype', zipfile.ZIP_STORED)
+        for root, dirs, files in os.walk(book_dir):
+            dirs.sort()
+            for file_name in sorted(files):
+                path = os.path.join(root, file_name)
+                name = os.path.relpath(path, book_dir).replace(os.sep, '/')
+                if name != 'mimetype':
+                    archive.write(path, name, zipfile.ZIP_DEFLATED)
+    return 'zipfile'
+
+# build the message list of the dock; with Qt, the list model is filled and every row is rendered
+def populate_dock(messages):
+    try:
+        from qt.core import Qt, QApplication
+        from calibre_plugins.epub_check.dock import MessageModel
+    except ImportError:
+        MessageModel = None
+    if MessageModel is not None and QApplication.instance() is not None:
+        model = MessageModel()
+        model.add_messages(messages)
+        for row in range(model.rowCount()):
+            model.data(model.index(row), Qt.DisplayRole)
+        return 'qt'
+    [message.message for message in messages]
+    return 'strings'
+
+def run_case(book_dir, work_dir, jvm_args, epc_path, json_output, max_messages, max_duplicates):
+    timings = {}
+    start = time.time()
+
+    # write the epub
+    epub_path = os.path.join(work_dir, 'book.epub')
+    t = time.time()
+    commit_mode = commit_book(book_dir, epub_path)
+    timings['commit'] = time.time() - t
+
+    # JVM startup
+    t = time.time()
+    jarWrapper(*(jvm_args + ['-version']))
+    timings['startup'] = time.time() - t
+
+    # EPUBCheck run; the output is only collected, it's parsed in the next stage
+    json_path = os.path.join(work_dir, 'report.json')
+    epc_args = (['--json', json_path] if json_output else []) + [epub_path]
+    stdout_lines, stderr_lines = [], []
+    t = time.time()
+    returncode = streamingJarWrapper(jvm_args + ['-jar', epc_path] + epc_args, stdout_lines.append, stderr_lines.append)
+    timings['epubcheck'] = time.time() - t
+
+    # parse the JSON report or the text messages
+    t = time.time()
+    with zipfile.ZipFile(epub_path) as archive:
+        name_to_href = make_name_to_href([href for href in archive.namelist() if not href.endswith('/')])
+    collector = MessageCollector(max_messages, max_duplicates)
+    if json_output:
+        report = read_json_report(json_path)
+        if report is not None:
+            for message in parse_json_report(report, name_to_href):
+                collector.add(message)
+    else:
+        for message in parse_lines(stderr_lines, name_to_href):
+            collector.add(message)
+    timings['parse'] = time.time() - t
+
+    # dock message list
+    t = time.time()
+    dock_mode = populate_dock(collector.messages)
+    timings['dock'] = time.time() - t
+    timings['total'] = time.time() - start
+
+    info = {'returncode': returncode, 'epub_size': os.path.getsize(epub_path), 'messages': collector.total,
+            'stored_messages': len(collector.messages), 'commit_mode': commit_mode, 'dock_mode': dock_mode}
+    return timings, info
+
+# micro-benchmark of the message parser; returns parsed lines and report locations per second
+def parser_benchmark(lines_count=100000, repeat=3):
+    rnd = random.Random(0)
+    name_to_href = dict(('ch{:04d}.xhtml'.format(i), 'OEBPS/Text/ch{:04d}.xhtml'.format(i)) for i in range(100))
+    names = sorted(name_to_href)
+    templates = (
+        'ERROR(RSC-005): /tmp/tmpa1b2c3/temp.epub/OEBPS/Text/{}({},{}): Error while parsing file: element "p" not allowed here; expected: "li"',
+        'WARNING(CSS-008): /tmp/tmpa1b2c3/temp.epub/OEBPS/Text/{}({},{}): An error occurred while parsing the CSS: Token illegal.',
+        'ERROR(RSC-012): /tmp/tmpa1b2c3/temp.epub/OEBPS/Text/{}({},{}): Fragment identifier is not defined.',
+        'USAGE(ACC-011): /tmp/tmpa1b2c3/temp.epub/OEBPS/Text/{}({},{}): Hyperlinks that are not in the reading order.',
+    )
+    lines = []
+    locations = []
+    for i in range(lines_count):
+        if i % 10 == 9:
+            lines.append('Validating using EPUB version 3.3 rules.')
+            continue
+        name = rnd.choice(names)
+        line, col = rnd.randint(1, 5000), rnd.randint(1, 200)
+        lines.append(rnd.choice(templates).format(name, line, col))
+        locations.append({'path': name_to_href[name], 'line': line, 'column': col})
+    report = {'messages': [{'ID': 'RSC-005', 'severity': 'ERROR', 'message': 'Error while parsing file.', 'locations': locations}]}
+
+    def best(func):
+        times = []
+        for i in range(max(1, repeat)):
+            t = time.time()
+            func()
+            times.append(time.time() - t)
+        return min(times)
+
+    text_seconds = best(lambda: sum(1 for message in parse_lines(lines, name_to_href)))
+    json_seconds = best(lambda: sum(1 for message in parse_json_report(report, name_to_href)))
+    return {
+        'lines': len(lines),
+        'text_lines_per_second': int(len(lines) / text_seconds) if text_seconds else None,
+        'json_locations_per_second': int(len(locations) / json_seconds) if json_seconds else None,
+    }
+
+# plugin modules that are imported when the tool is first used, not when the editor starts
+ENGINE_MODULES = ('checker', 'message_parser', 'updater', 'daemon', 'cache', 'timing', 'faststart', 'incremental', 'preflight', 'history')
+
+# import time of the check engine in a new interpreter (-X importtime); None if it can't be measured
+def import_benchmark(modules=ENGINE_MODULES, repeat=3):
+    plugin_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for i in range(max(1, repeat)):
+        try:
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+                                     cwd=plugin_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if process.returncode != 0:
+            return None
+
+        # import time: self [us] | cumulative | imported package; top-level imports are indented by one space
+        times = {}
+        for line in process.stderr.decode('utf-8', 'replace').splitlines():
+            match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\| (\S+)$', line)
+            if match is not None and match.group(2) in modules:
+                times[match.group(2)] = int(match.group(1)) / 1000.0
+        total = sum(times.values())
+        if best is None or total < best['total_ms']:
+            best = {'total_ms': round(total, 2), 'modules_ms': dict((name, round(ms, 2)) for name, ms in times.items())}
+    return best
+
+# modules that the editor has loaded before it loads the tool
+EDITOR_MODULES = ('qt.core', 'calibre.gui2.tweak_book.plugin', 'calibre.gui2.tweak_book', 'calibre.utils.config', 'lxml.etree')
+
+# import the plugin like calibre does, after the modules of the editor; calibre's loader of zipped plugins is replaced by the plugin folder
+PLUGIN_IMPORT = '''
+import sys, types
+import {editor_modules}
+package = types.ModuleType('calibre_plugins')
+package.__path__ = [{packages_dir!r}]
+sys.modules['calibre_plugins'] = package
+import {module}
+'''
+
+def plugin_import_time(plugin_dir, module, repeat=3):
+    '''
+    Returns the import time in ms of a plugin module (e.g. calibre_plugins.epub_check.main) in a new interpreter,
+    without the time of the editor modules; None if it can't be imported, e.g. outside of calibre-debug.
+    '''
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # the plugin's __init__ isn't imported when the tool is loaded
+        package_dir = os.path.join(temp_dir, 'epub_check')
+        os.mkdir(package_dir)
+        open(os.path.join(package_dir, '__init__.py'), 'wb').close()
+        for file_name in os.listdir(plugin_dir):
+            if file_name.endswith('.py') and file_name != '__init__.py':
+                shutil.copy(os.path.join(plugin_dir, file_name), package_dir)
+        code = PLUGIN_IMPORT.format(editor_modules=', '.join(EDITOR_MODULES), packages_dir=temp_dir, module=module)
+        best = None
+        for i in range(max(1, repeat)):
+            try:
+                process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=temp_dir,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+            except (OSError, subprocess.TimeoutExpired):
+                return None
+            if process.returncode != 0:
+                return None
+            for line in process.stderr.decode('utf-8', 'replace').splitlines():
+                match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\| (\S+)$', line)
+                if match is not None and match.group(2).strip() == module:
+                    ms = int(match.group(1)) / 1000.0
+                    best = ms if best is None else min(best, ms)
+        return round(best, 2) if best is not None else None
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+# import time of the tool when the editor starts and of the check engine and the dock when the tool is first used;
+# before_dir is a copy of the plugin folder of an earlier version, e.g. the one that imported everything in main.py
+def tool_import_benchmark(before_dir=None, repeat=3):
+    plugin_dir = os.path.dirname(os.path.abspath(__file__))
+    result = {
+        'startup_ms': plugin_import_time(plugin_dir, 'calibre_plugins.epub_check.main', repeat),
+        'first_use_ms': plugin_import_time(plugin_dir, 'calibre_plugins.epub_check.controller', repeat),
+    }
+    if result['startup_ms'] is None:
+        return None
+    if before_dir is not None:
+        result['startup_before_ms'] = plugin_import_time(before_dir, 'calibre_plugins.epub_check.main', repeat)
+    return result
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+# print the change of every stage against an earlier benchmark result
+def compare(old, new):
+    old_cases = dict((case['name'], case) for case in old.get('cases', []))
+    print('Compared with plugin version {} ({})'.format(old.get('plugin_version', '?'), old.get('date', '?')))
+    if old.get('output') != new['output'] or old.get('epubcheck') != new['epubcheck']:
+        print('  Note: the results were measured with {} output of {}, not {} output of {}'.format(
+            old.get('output'), old.get('epubcheck'), new['output'], new['epubcheck']))
+    for case in new['cases']:
+        old_case = old_cases.get(case['name'])
+        if old_case is None:
+            continue
+        changes = []
+        for stage in STAGES:
+            old_time = old_case['stages'].get(stage, {}).get('median')
+            new_time = case['stages'][stage]['median']
+            if old_time:
+                changes.append('{} {:+.0%}'.format(stage, new_time / old_time - 1))
+        print('  {}: {}'.format(case['name'], ', '.join(changes)))
+    old_parser = old.get('parser') or {}
+    for key in ('text_lines_per_second', 'json_locations_per_second'):
+        if old_parser.get(key) and new.get('parser', {}).get(key):
+            print('  parser {}: {:+.0%}'.format(key, new['parser'][key] / old_parser[key] - 1))
+    old_imports = old.get('imports') or {}
+    if old_imports.get('total_ms') and new.get('imports'):
+        print('  check engine imports: {:.1f} ms -> {:.1f} ms'.format(old_imports['total_ms'], new['imports']['total_ms']))
+    old_tool = old.get('tool_imports') or {}
+    if old_tool.get('startup_ms') and new.get('tool_imports'):
+        print('  tool import at editor startup: {:.1f} ms -> {:.1f} ms'.format(old_tool['startup_ms'], new['tool_imports']['startup_ms']))
+
+def parse_case(value):
+    try:
+        name, files, file_size, error_density = value.split(',')
+        return name, int(files), int(file_size), float(error_density)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected name,files,KB,density, e.g. huge,1000,100,0.1')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the EPUBCheck plugin pipeline on a synthetic corpus.')
+    parser.add_argument('--case', dest='cases', action='append', type=parse_case,
+                        help='corpus case name,files,KB per file,share of paragraphs with messages (repeatable)')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='runs per case; the median is reported (default: 3)')
+    parser.add_argument('--text', dest='json_output', action='store_false', help='parse the text output instead of the JSON report')
+    parser.add_argument('--java', help='path to the java binary (default: the EPUBCheck stand-in)')
+    parser.add_argument('--epubcheck-dir', help='folder with epubcheck.jar and lib/ (default: the EPUBCheck stand-in)')
+    parser.add_argument('--startup', type=float, default=0.3, help='simulated JVM startup time of the stand-in in seconds')
+    parser.add_argument('--rate', type=float, default=20.0, help='simulated validation speed of the stand-in in MB/s')
+    parser.add_argument('--max-messages', type=int, default=10000, help='maximum number of stored messages')
+    parser.add_argument('--max-duplicates', type=int, default=10, help='identical messages stored before they are only counted')
+    parser.add_argument('--parser-lines', type=int, default=100000, help='lines of the parser micro-benchmark (0: skip it)')
+    parser.add_argument('--no-import-time', dest='import_time', action='store_false', help="don't measure the import time of the check engine")
+    parser.add_argument('--before-dir', help='plugin folder of an earlier version; the import time of its main.py is measured, too (needs calibre-debug)')
+    parser.add_argument('--corpus-dir', help='keep the generated books in this folder')
+    parser.add_argument('-o', '--output', help='write the JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='earlier JSON results to compare with')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        #--------------------------------------------
+        # EPUBCheck or the stand-in
+        #--------------------------------------------
+        if args.java and args.epubcheck_dir:
+            epc_path = os.path.join(args.epubcheck_dir, 'epubcheck.jar')
+            jvm_args = build_args(args.java)[0]
+            epubcheck = get_epc_version(epc_path)
+        else:
+            epc_path = os.path.join(work_dir, 'epubcheck.jar')
+            script_path = os.path.join(work_dir, 'fake_epubcheck.py')
+            with open(script_path, 'wb') as f:
+                f.write(FAKE_EPUBCHECK.encode('utf-8'))
+            jvm_args = [sys.executable, script_path, '-Dfake.startup={}'.format(args.startup), '-Dfake.rate={}'.format(args.rate)]
+            epubcheck = 'stand-in'
+
+        #--------------------------------------------
+        # generate the corpus and run the cases
+        #--------------------------------------------
+        corpus_dir = args.corpus_dir or os.path.join(work_dir, 'corpus')
+        results = []
+        for seed, (name, files, file_size, error_density) in enumerate(args.cases or DEFAULT_CASES):
+            book_dir = os.path.join(corpus_dir, name)
+            if os.path.exists(book_dir):
+                shutil.rmtree(book_dir)
+            marked = generate_book(book_dir, files, file_size, error_density, seed)
+            runs = []
+            for i in range(max(1, args.repeat)):
+                case_dir = tempfile.mkdtemp(dir=work_dir)
+                runs.append(run_case(book_dir, case_dir, jvm_args, epc_path, args.json_output, args.max_messages, args.max_duplicates))
+                shutil.rmtree(case_dir, ignore_errors=True)
+            info = runs[-1][1]
+            stages = dict((stage, {'median': round(median([timings[stage] for timings, i in runs]), 4),
+                                   'min': round(min(timings[stage] for timings, i in runs), 4)}) for stage in STAGES)
+            results.append(dict(info, name=name, files=files, file_size_kb=file_size, error_density=error_density,
+                                marked_paragraphs=marked, runs=len(runs), stages=stages))
+            sys.stderr.write('{}: {:.3f} s ({:,} messages)\n'.format(name, stages['total']['median'], info['messages']))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        'plugin_version': plugin_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'epubcheck': epubcheck,
+        'output': 'json' if args.json_output else 'text',
+        'cases': results,
+    }
+    if args.parser_lines:
+        result['parser'] = parser_benchmark(args.parser_lines, args.repeat)
+        sys.stderr.write('parser: {:,} lines/s (text), {:,} locations/s (JSON)\n'.format(
+            result['parser']['text_lines_per_second'], result['parser']['json_locations_per_second']))
+    if args.import_time:
+        result['imports'] = import_benchmark(repeat=args.repeat)
+        if result['imports'] is not None:
+            sys.stderr.write('check engine imports: {:.1f} ms, deferred until the tool is first used\n'.format(result['imports']['total_ms']))
+
+        # the imports of main.py and controller.py need calibre and Qt
+        result['tool_imports'] = tool_import_benchmark(args.before_dir, args.repeat)
+        tool_imports = result['tool_imports']
+        if tool_imports is None:
+            sys.stderr.write('tool imports: not measured, run the benchmark with calibre-debug\n')
+        else:
+            sys.stderr.write('tool import at editor startup: {:.1f} ms{}, controller and dock on first use: {}\n'.format(
+                tool_imports['startup_ms'],
+                ' (before: {:.1f} ms)'.format(tool_imports['startup_before_ms']) if tool_imports.get('startup_before_ms') is not None else '',
+                '{:.1f} ms'.format(tool_imports['first_use_ms']) if tool_imports['first_use_ms'] is not None else 'failed'))
+    data = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(data.encode('utf-8'))
+    else:
+        print(data)
+
+    if args.compare:
+        with open(args.compare, 'rb') as f:
+            compare(json.loads(f.read().decode('utf-8')), result)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# checks of other books while a book is open in the editor
+
+# standard libraries
+import os, threading
+from queue import Queue, Empty
+
+# Qt
+from qt.core import (
+    QObject, pyqtSignal, QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem,
+    QPushButton, QDialogButtonBox, QFileDialog, Qt
+)
+
+# plugin libraries
+from calibre_plugins.epub_check.batch import check_book
+from calibre_plugins.epub_check.message_parser import Message
+from calibre_plugins.epub_check.daemon import jvm_slots
+
+# get the books that were recently opened in the editor, without the current book
+def recent_books(current_book=None):
+    try:
+        from calibre.gui2.tweak_book import tprefs
+        paths = tprefs.get('recent-books', [])
+    except ImportError:
+        paths = []
+    return [path for path in paths if path != current_book and path.lower().endswith('.epub') and os.path.isfile(path)]
+
+class BookQueue(QObject):
+    '''
+    Checks queued books on at most max_jvms background threads; each check waits for one of the shared jvm_slots.
+    '''
+
+    book_started = pyqtSignal(object)
+    book_finished = pyqtSignal(object)
+
+    def __init__(self, max_jvms=1):
+        QObject.__init__(self)
+        self.max_jvms = max(1, max_jvms)
+        self.tasks = Queue()
+        self.removed = set()
+        # 'queued' or 'checking' by book path
+        self.states = {}
+        self.workers = 0
+        self.lock = threading.Lock()
+
+    def add(self, book_path, jvm_args, epc_path, epc_args, usage=False, json_output=True, max_messages=10000, max_duplicates=10, message_filter=None):
+        ''' Queues a book; returns False if the book is already queued or being checked, that check is kept then even if it was removed '''
+        with self.lock:
+            self.removed.discard(book_path)
+            if book_path in self.states:
+                return False
+            self.states[book_path] = 'queued'
+            self.tasks.put((book_path, jvm_args, epc_path, epc_args, usage, json_output, max_messages, max_duplicates, message_filter))
+            if self.workers < self.max_jvms:
+                self.workers += 1
+                thread = threading.Thread(target=self.work, name='EPUBCheckQueue')
+                thread.daemon = True
+                thread.start()
+            return True
+
+    def remove(self, book_path):
+        ''' Drops a queued book; the result of a running check is discarded '''
+        with self.lock:
+            if book_path in self.states:
+                self.removed.add(book_path)
+
+    def state(self, book_path):
+        with self.lock:
+            return self.states.get(book_path)
+
+    def drop(self, book_path, finished=False):
+        # forgets a removed or finished book; returns True if the book was removed
+        with self.lock:
+            removed = book_path in self.removed
+            if removed or finished:
+                self.removed.discard(book_path)
+                del self.states[book_path]
+            return removed
+
+    def work(self):
+        while True:
+            with self.lock:
+                try:
+                    task = self.tasks.get_nowait()
+                except Empty:
+                    self.workers -= 1
+                    return
+            book_path = task[0]
+            if self.drop(book_path) or not jvm_slots.acquire(lambda: self.drop(book_path)):
+                continue
+            with self.lock:
+                self.states[book_path] = 'checking'
+            self.book_started.emit(book_path)
+            try:
+                book = check_book(*task)
+            except Exception:
+                import traceback
+                book = {'path': book_path, 'returncode': None, 'java_error': traceback.format_exc(), 'messages': [], 'seconds': 0}
+            finally:
+                jvm_slots.release()
+            if self.drop(book_path, finished=True):
+                continue
+            book['messages'] = [Message(msg['file'], msg['line'], msg['column'], msg['code'], msg['message'], msg['count']) for msg in book['messages']]
+            self.book_finished.emit(book)
+
+class BookChooser(QDialog):
+    '''
+    Selects the books to check: recently edited books and any other epub files.
+    '''
+
+    def __init__(self, parent, current_book=None):
+        QDialog.__init__(self, parent)
+        self.setWindowTitle('Check more books')
+        self.book_list = QListWidget()
+        for path in recent_books(current_book):
+            self.add_book(path, Qt.Unchecked)
+        add_button = QPushButton('Add files...')
+        add_button.clicked.connect(self.add_files)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(add_button)
+        button_layout.addStretch(1)
+        button_layout.addWidget(buttons)
+        l = QVBoxLayout()
+        l.addWidget(QLabel('Recently edited books:'))
+        l.addWidget(self.book_list)
+        l.addLayout(button_layout)
+        self.setLayout(l)
+        self.resize(600, 400)
+
+    def add_book(self, path, state):
+        item = QListWidgetItem(path)
+        item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+        item.setCheckState(state)
+        self.book_list.addItem(item)
+
+    def add_files(self):
+        paths, selected_filter = QFileDialog.getOpenFileNames(self, 'Select books', '', 'EPUB files (*.epub)')
+        existing = set(self.book_list.item(i).text() for i in range(self.book_list.count()))
+        for path in paths:
+            if path not in existing:
+                self.add_book(path, Qt.Checked)
+
+    def books(self):
+        return [self.book_list.item(i).text() for i in range(self.book_list.count()) if self.book_list.item(i).checkState() == Qt.Checked]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# standard libraries
+import os, json, hashlib, zipfile, threading
+
+def hash_file(path, block_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+# hash the contents of an epub, read from its central directory: the entry names, CRC-32s and sizes;
+# the time stamps and the order of the entries change when a book is reopened or edited and don't matter
+def hash_epub(path):
+    try:
+        with zipfile.ZipFile(path) as archive:
+            infos = archive.infolist()
+    except (zipfile.BadZipfile, OSError):
+        return hash_file(path)
+    entries = sorted((info.filename, info.CRC, info.file_size) for info in infos)
+    # EPUBCheck checks that the mimetype file is the first, uncompressed entry
+    first = [infos[0].filename, infos[0].compress_type] if infos else None
+    return hashlib.sha256(json.dumps([first, entries]).encode('utf-8')).hexdigest()
+
+class ResultCache(object):
+    '''
+    A size bounded, least recently used disk cache of parsed EPUBCheck results.
+
+    Entries are keyed by the hash of the contents of the checked epub, the EPUBCheck version and the
+    EPUBCheck options; the access time of an entry is its file modification time.
+    '''
+
+    def __init__(self, cache_dir, max_size=100 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.stats_path = os.path.join(cache_dir, 'stats.json')
+        self.lock = threading.Lock()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, epub_path, epc_version, options):
+        h = hashlib.sha256()
+        h.update(hash_epub(epub_path).encode('ascii'))
+        h.update(json.dumps([epc_version, list(options)]).encode('utf-8'))
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        ''' Returns the cached result or None '''
+        path = self.entry_path(key)
+        entry = None
+        with self.lock:
+            try:
+                with open(path, 'rb') as f:
+                    entry = json.loads(f.read().decode('utf-8'))
+                os.utime(path, None)
+                if 'messages' not in entry:
+                    entry = None
+            except (OSError, ValueError, TypeError):
+                entry = None
+            self.update_stats('hits' if entry is not None else 'misses')
+        return entry
+
+    def put(self, key, messages, stdout='', stderr='', returncode=0):
+        entry = {'messages': messages, 'stdout': stdout, 'stderr': stderr, 'returncode': returncode}
+        path = self.entry_path(key)
+        with self.lock:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(json.dumps(entry).encode('utf-8'))
+            os.replace(path + '.tmp', path)
+            self.evict()
+
+    def evict(self):
+        ''' Deletes the least recently used entries until the cache fits into max_size '''
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith('.json') and file_name != 'stats.json':
+                st = os.stat(os.path.join(self.cache_dir, file_name))
+                entries.append((st.st_mtime, st.st_size, file_name))
+                total_size += st.st_size
+        entries.sort()
+        while entries and total_size > self.max_size:
+            mtime, size, file_name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+                self.update_stats('evictions')
+            except OSError:
+                pass
+            total_size -= size
+
+    def stats(self):
+        try:
+            with open(self.stats_path, 'rb') as f:
+                stats = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError):
+            stats = {}
+        for counter in ('hits', 'misses', 'evictions'):
+            stats.setdefault(counter, 0)
+        return stats
+
+    def update_stats(self, counter):
+        stats = self.stats()
+        stats[counter] += 1
+        try:
+            with open(self.stats_path, 'wb') as f:
+                f.write(json.dumps(stats).encode('utf-8'))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith('.json'):
+                    os.remove(os.path.join(self.cache_dir, file_name))
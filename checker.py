@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2016, 2017, 2018, 2019, 2020, 2021, 2022, 2023 Doitsu'
+
+# EPUBCheck and Java versions, the command line and the process that runs a check
+
+# standard libraries
+import zipfile
+import re, os, sys, threading
+from datetime import datetime
+
+# calibre libraries (optional, for use outside of calibre)
+try:
+    from calibre.constants import iswindows, isosx
+except ImportError:
+    iswindows = sys.platform.startswith('win')
+    isosx = sys.platform == 'darwin'
+
+try:
+    from calibre_plugins.epub_check.timing import timed
+    from calibre_plugins.epub_check.message_parser import Message
+except ImportError:
+    from timing import timed
+    from message_parser import Message
+
+# get epubcheck.jar version number
+@timed('get_epc_version')
+def get_epc_version(epc_path):
+    version = ''
+
+    # make sure that epubcheck.jar actually exists
+    if os.path.exists(epc_path):
+
+        # read .jar file as zip file
+        archive = zipfile.ZipFile(epc_path)
+
+        # make sure that pom.xml exists
+        if 'META-INF/maven/org.w3c/epubcheck/pom.xml' in archive.namelist():
+            pom_data = archive.read('META-INF/maven/org.w3c/epubcheck/pom.xml')
+            archive.close()
+
+            # parse pom.xml as ElementTree
+            from xml.etree import ElementTree as ET
+            root = ET.fromstring(pom_data)
+            tag = root.find("*//{http://maven.apache.org/POM/4.0.0}tag")
+            # look for <tag>
+            if tag is not None:
+                version = tag.text
+            else:
+                # look for <version>
+                project_version = root.find("{http://maven.apache.org/POM/4.0.0}version")
+                if project_version is not None:
+                    version = 'v' + project_version.text
+        else:
+            print('pom.xml not found!') 
+    else:
+        print('epubcheck.jar not found!')
+
+    return version
+
+# code provided by DiapDealer
+def string_to_date(datestring):
+    return datetime.strptime(datestring, "%Y-%m-%d %H:%M:%S.%f")
+
+# jar wrapper for epubcheck
+@timed('jarWrapper')
+def jarWrapper(*args, **kwargs):
+    import subprocess
+    started = kwargs.get('started', None)
+    startupinfo = None
+
+    # stop the windows console popping up every time the prog is run
+    if iswindows:
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+
+    process = subprocess.Popen(list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
+
+    # allow the caller to kill the process
+    if started is not None:
+        started(process)
+    ret = process.communicate()
+    returncode = process.returncode
+    return ret, returncode
+
+# read a pipe line by line
+def _pump(pipe, on_line):
+    for raw_line in iter(pipe.readline, b''):
+        on_line(raw_line.decode('utf-8', 'replace').rstrip('\r\n'))
+    pipe.close()
+
+# get the peak working set of a finished Windows process in bytes
+def _windows_peak_rss(process):
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(int(process._handle), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError, ValueError):
+        pass
+    return None
+
+# wait for a child process; returns its return code and peak resident set size in bytes (None if unknown)
+def wait_process(process):
+    if hasattr(os, 'wait4'):
+        try:
+            pid, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            return process.wait(), None
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return process.returncode, rusage.ru_maxrss * (1 if isosx else 1024)
+    returncode = process.wait()
+    return returncode, _windows_peak_rss(process) if iswindows else None
+
+# jar wrapper that passes each output line to a callback instead of buffering the output;
+# the peak memory use of the process is stored in stats['peak_rss_bytes']
+@timed('streamingJarWrapper')
+def streamingJarWrapper(args, on_stdout_line, on_stderr_line, started=None, stats=None):
+    import subprocess
+    from threading import Thread
+    startupinfo = None
+
+    # stop the windows console popping up every time the prog is run
+    if iswindows:
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+
+    process = subprocess.Popen(list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
+
+    # allow the caller to kill the process
+    if started is not None:
+        started(process)
+
+    # read stdout in a second thread to avoid dead locks
+    stdout_reader = Thread(target=_pump, args=(process.stdout, on_stdout_line))
+    stdout_reader.daemon = True
+    stdout_reader.start()
+    _pump(process.stderr, on_stderr_line)
+    stdout_reader.join()
+    returncode, peak_rss = wait_process(process)
+    if stats is not None and peak_rss is not None:
+        stats['peak_rss_bytes'] = max(stats.get('peak_rss_bytes', 0), peak_rss)
+    return returncode
+
+# get JVM bitness and Java version
+@timed('get_java_info')
+def get_java_info(java_path):
+    arch = '64'
+    java_version = ''
+    args = [java_path, '-XshowSettings:properties', '-version']
+    try:
+        ret, retcode = jarWrapper(*args)
+    except OSError:
+        print('Java not found:', java_path)
+        return arch, java_version
+    settings = ret[1].decode('utf-8', 'replace')
+    arch_pattern = re.compile(r'sun.arch.data.model = (\d+)')
+    arch_info = arch_pattern.search(settings)
+    if arch_info:
+        if len(arch_info.groups()) == 1:
+            arch = arch_info.group(1)
+            print('Java bitness detected:', arch)
+    else:
+        print('Java bitness not detected!' )
+    version_info = re.search(r'java.version = (\S+)', settings)
+    if version_info:
+        java_version = version_info.group(1)
+    return arch, java_version
+
+# get the modification time and size of a file
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
+
+# get the cached Java and EPUBCheck information; only probe Java and epubcheck.jar again if they changed
+@timed('get_environment')
+def get_environment(prefs, java_path, epc_path):
+    import shutil
+    env = dict(prefs.get('environment', {}))
+    changed = False
+
+    # java binary
+    java_binary = shutil.which(java_path) or java_path
+    java_stamp = file_stamp(java_binary)
+    if env.get('java_path') != java_path or env.get('java_stamp') != java_stamp or 'is32bit' not in env:
+        arch, java_version = get_java_info(java_path)
+        env.update({'java_path': java_path, 'java_stamp': java_stamp, 'is32bit': arch == '32', 'java_version': java_version})
+        changed = True
+
+    # epubcheck.jar
+    epc_stamp = file_stamp(epc_path)
+    if env.get('epc_path') != epc_path or env.get('epc_stamp') != epc_stamp or 'epc_version' not in env:
+        env.update({'epc_path': epc_path, 'epc_stamp': epc_stamp, 'epc_version': get_epc_version(epc_path) if epc_stamp else ''})
+        changed = True
+
+    if changed:
+        prefs['environment'] = env
+        if hasattr(prefs, 'commit'):
+            prefs.commit()
+    return env
+
+# assemble the JVM and EPUBCheck command line parameters
+def build_args(java_path, is32bit=False, locale=None, usage=False):
+    # define JVM parameters
+    if is32bit:
+        jvm_args = [java_path, '-Dfile.encoding=UTF8', '-Xss1024k']
+    else:
+        jvm_args = [java_path, '-Dfile.encoding=UTF8']
+
+    # define epubcheck command line parameters
+    epc_args = []
+
+    # display messages in a different language
+    if locale is not None:
+        epc_args.extend(['--locale', locale])
+
+    # display usage messages
+    if usage:
+        epc_args.append('--usage')
+
+    return jvm_args, epc_args
+
+class MessageCollector(object):
+    '''
+    Collects messages with bounded memory: identical messages beyond max_duplicates are counted
+    instead of stored, and once max_messages are stored, further messages are counted per
+    error code and file.
+    '''
+
+    def __init__(self, max_messages=10000, max_duplicates=10):
+        self.max_messages = max_messages
+        self.max_duplicates = max_duplicates
+        self.messages = []
+        self.new_messages = []
+        self.duplicates = {}
+        self.overflow = {}
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def add(self, message):
+        with self.lock:
+            self.total += 1
+            key = (message.err_code, message.filepath, message.msg)
+            stored = self.duplicates.get(key)
+            if stored is not None and stored[0] >= self.max_duplicates:
+                stored[1].count += 1
+                return
+            if len(self.messages) >= self.max_messages:
+                # count the message per error code and file
+                overflow_key = (message.err_code, message.filepath)
+                collapsed = self.overflow.get(overflow_key)
+                if collapsed is not None:
+                    collapsed.count += 1
+                    return
+                message = Message(message.filepath, None, None, message.err_code, message.msg)
+                self.overflow[overflow_key] = message
+            elif stored is not None:
+                stored[0] += 1
+                stored[1] = message
+            else:
+                self.duplicates[key] = [1, message]
+            self.messages.append(message)
+            self.new_messages.append(message)
+
+    def take_new_messages(self):
+        with self.lock:
+            new_messages = self.new_messages
+            self.new_messages = []
+        return new_messages
@@ -0,0 +1,1487 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2016, 2017, 2018, 2019, 2020, 2021, 2022, 2023 Doitsu'
+
+# the check engine, the updater and the dock of the tool; loaded when the tool is first used
+
+# standard libraries
+import os, tempfile, shutil, time, weakref, sqlite3
+from functools import partial
+from datetime import datetime, timedelta
+from threading import Thread
+from collections import deque
+
+# Qt
+from qt.core import (
+    QTextEdit, QDockWidget, QApplication, QMessageBox, QVBoxLayout, Qt,
+    QObject, QWidget, QLabel, QPushButton, QProgressBar, QHBoxLayout, pyqtSignal,
+    QListView, QComboBox, QLineEdit, QTimer, QToolButton, QCheckBox, QTabWidget, QTabBar, QDialog
+)
+
+# Calibre libraries
+from calibre.utils.config import config_dir
+from calibre.ebooks.oeb.polish.container import clone_container
+from calibre.gui2.tweak_book import editors
+
+# plugin libraries
+from calibre_plugins.epub_check.main import get_prefs
+from calibre_plugins.epub_check.checker import (
+    get_epc_version, string_to_date, streamingJarWrapper, get_environment, build_args, MessageCollector
+)
+from calibre_plugins.epub_check.message_parser import parse_line, read_json_report, parse_json_report, make_name_to_href, Message, MESSAGE_TYPES
+from calibre_plugins.epub_check.dock import MessageModel, SEVERITY_FILTERS, CHANGE_FILTERS, GROUP_MODES, SORT_KEYS
+from calibre_plugins.epub_check.updater import fetch_latest_release, download_and_install, UpdateError
+from calibre_plugins.epub_check.daemon import get_daemon, shutdown_daemon, DaemonError, DaemonPool, jvm_slots
+from calibre_plugins.epub_check.cache import ResultCache
+from calibre_plugins.epub_check.timing import Timings, set_active, append_log
+from calibre_plugins.epub_check.faststart import get_tuning_args, fast_start_args, archive_is_current, archive_stamp, create_archive, java_major_version, book_size
+from calibre_plugins.epub_check.incremental import CheckState, fingerprint_container, plan_check, plan_parallel_check, merge_messages, is_cross_file
+from calibre_plugins.epub_check.preflight import run_preflight, run_file_preflight, has_fatal, reported_by_epubcheck
+from calibre_plugins.epub_check.history import History, book_identifier, diff_messages
+from calibre_plugins.epub_check.bookqueue import BookQueue, BookChooser
+from calibre_plugins.epub_check.profiles import get_profiles, get_profile, profile_options
+from calibre_plugins.epub_check.workspace import Workspace, scratch_root, cleanup_workspaces, cleanup_runs, RUN_PREFIX
+
+class EpubCheckWorker(QObject):
+    '''
+    Writes a copy of the book to disk, runs EPUBCheck and parses its output in a background thread.
+    '''
+
+    messages_found = pyqtSignal(object)
+    messages_cleared = pyqtSignal()
+    status_changed = pyqtSignal(object)
+    finished = pyqtSignal(object)
+
+    # number of messages sent to the dock at a time
+    batch_size = 250
+
+    # number of regular (non-message) output lines kept per EPUBCheck run
+    max_output_lines = 500
+
+    def __init__(self, container, temp_dir, jvm_args, epc_path, epc_args, epub_name_to_href, usage=False, daemon=False, daemon_idle_timeout=600,
+                 check_files=None, cached_messages=None, epub_version='3.0', result_cache=None, json_output=True,
+                 max_messages=10000, max_duplicates=10, epc_version='', oneshot_jvm_args=None, timings=None,
+                 parallel_jobs=1, message_filter=None, workspace=None, preflight=False, preflight_skip_java=False,
+                 fingerprints=None, preflight_cache=None, book_run=False):
+        QObject.__init__(self)
+        # book_run: the whole book is checked alongside the check_files, e.g. by a parallel check
+        self.book_run = book_run
+        # the files that are checked on their own while the whole book is checked, too
+        self.split_names = set()
+        self.preflight_messages = []
+        self.preflight = preflight
+        self.preflight_skip_java = preflight_skip_java
+        self.fingerprints = fingerprints
+        self.preflight_cache = preflight_cache
+        self.workspace = workspace
+        self.message_filter = message_filter
+        self.parallel_jobs = parallel_jobs
+        self.running_pool = None
+        self.timings = timings if timings is not None else Timings()
+        self.oneshot_jvm_args = oneshot_jvm_args if oneshot_jvm_args is not None else jvm_args
+        self.jvm_seconds = 0.0
+        self.used_daemon = False
+        self.epc_version = epc_version
+        self.result_cache = result_cache
+        self.json_output = json_output
+        self.run_count = 0
+        self.collector = MessageCollector(max_messages, max_duplicates)
+        self.container = container
+        self.check_files = check_files
+        # the container names of the checked files; file checks use copies with the same file name
+        self.file_names = dict((path, name) for path, mode, name in check_files or [])
+        self.cached_messages = cached_messages
+        self.epub_version = epub_version
+        self.temp_dir = temp_dir
+        self.jvm_args = jvm_args
+        self.epc_path = epc_path
+        self.epc_args = epc_args
+        self.epub_name_to_href = epub_name_to_href
+        self.usage = usage
+        self.daemon = daemon
+        self.daemon_idle_timeout = daemon_idle_timeout
+        self.process = None
+        self.running_daemon = None
+        self.cancelled = False
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.run, name='EPUBCheckWorker')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.running_daemon is not None:
+            self.running_daemon.cancel()
+        if self.running_pool is not None:
+            self.running_pool.cancel()
+        if self.process is not None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+
+    def process_started(self, process):
+        self.process = process
+        if self.cancelled:
+            process.kill()
+
+    def run(self):
+        result = {'stdout': '', 'stderr': '', 'returncode': None, 'error': None, 'cached': False, 'skipped': False}
+        set_active(self.timings)
+        try:
+            self.run_check(result)
+        except Exception:
+            import traceback
+            result['error'] = traceback.format_exc()
+        finally:
+            set_active(None)
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            result['cancelled'] = self.cancelled
+            result['seconds'] = self.jvm_seconds
+            result['daemon'] = self.used_daemon
+            self.timings.count('messages', self.collector.total)
+            self.timings.count('stored_messages', len(self.collector.messages))
+            self.finished.emit(result)
+
+    def run_check(self, result):
+        cache_key = None
+
+        # add the previous messages of unchanged files
+        if self.cached_messages:
+            self.emit_messages(self.cached_messages)
+
+        # cheap structural checks of the container copy or the changed files, their messages are shown before the JVM has started
+        if self.preflight:
+            self.status_changed.emit('Running pre-flight checks...')
+            if self.container is not None:
+                preflight_messages = run_preflight(self.container, self.fingerprints, self.preflight_cache)
+            else:
+                preflight_messages = run_file_preflight([(path, name) for path, mode, name in self.check_files])
+
+            # the check profile's filter applies to the pre-flight messages, too
+            if self.message_filter is not None:
+                preflight_messages = [message for message in preflight_messages if self.message_filter.accepts(message.err_code)]
+            self.emit_messages(preflight_messages)
+            self.preflight_messages = preflight_messages
+
+            # the book can't be valid; EPUBCheck is skipped if the user chose so
+            if self.preflight_skip_java and has_fatal(preflight_messages):
+                result['returncode'] = 1
+                result['skipped'] = True
+                return
+
+        runs = []
+        if self.check_files is None or self.book_run:
+            # write the container copy to a temporary epub; the epub in the book's workspace is updated in place
+            self.status_changed.emit('Saving book...')
+            if self.workspace is not None:
+                epub_path = self.workspace.epub_path
+                with self.timings.span('commit'):
+                    written = self.workspace.sync(self.container.root)
+                self.timings.count('rewritten_entries', len(written))
+            else:
+                epub_path = os.path.join(self.temp_dir, 'temp.epub')
+                with self.timings.span('commit'):
+                    self.container.commit(epub_path)
+            self.timings.count('epub_bytes', os.path.getsize(epub_path))
+
+            # reuse the result of an identical book
+            if self.result_cache is not None:
+                self.status_changed.emit('Looking up cached results...')
+                with self.timings.span('result cache'):
+                    options = self.epc_args if self.message_filter is None else self.epc_args + self.message_filter.key()
+                    cache_key = self.result_cache.key(epub_path, self.epc_version, options)
+                    entry = self.result_cache.get(cache_key)
+                if entry is not None:
+                    result['stdout'] = entry['stdout']
+                    result['stderr'] = entry['stderr']
+                    result['returncode'] = entry['returncode']
+                    result['cached'] = True
+                    self.emit_messages([Message.from_list(data) for data in entry['messages']])
+                    return
+            runs.append(self.epc_args + [epub_path])
+        if self.check_files is not None:
+            # check the changed content documents, or the files of a parallel check, on their own
+            runs += [self.epc_args + ['--mode', mode, '-v', self.epub_version, path] for path, mode, name in self.check_files]
+
+        # check the files on a pool of JVMs
+        if self.parallel_jobs > 1 and len(runs) > 1:
+            if self.run_parallel(runs, result):
+                return
+            if self.cancelled:
+                return
+
+            # without the pool, the whole book run covers the files
+            if self.book_run:
+                runs = runs[:1]
+
+        for epc_args in runs:
+            if self.cancelled or not self.run_epubcheck(epc_args, result):
+                return
+
+        # cache the result of a full check
+        if cache_key is not None:
+            self.result_cache.put(cache_key, [message.to_list() for message in self.collector.messages], result['stdout'], result['stderr'], result['returncode'])
+
+    def prepare_run(self, epc_args):
+        # ask EPUBCheck for a JSON report
+        json_path = None
+        if self.json_output:
+            self.run_count += 1
+            json_path = os.path.join(self.temp_dir, 'report{}.json'.format(self.run_count))
+            epc_args = ['--json', json_path] + epc_args
+        return epc_args, json_path
+
+    def run_name_to_href(self, epc_args):
+        # the messages of a single file check refer to the checked file, whatever its file name
+        name = self.file_names.get(epc_args[-1])
+        if name is None:
+            return self.epub_name_to_href
+        return {os.path.basename(epc_args[-1]): name}
+
+    def run_skipped_names(self, epc_args):
+        # the whole book run of a parallel check leaves the messages of the files that are checked on their own to
+        # their runs, except for the cross-file messages that single file checks can't report
+        if self.split_names and self.file_names.get(epc_args[-1]) is None:
+            return self.split_names
+        return None
+
+    def collect(self, message, skipped_names=None):
+        if skipped_names and message.filepath in skipped_names and not is_cross_file(message):
+            return
+        self.collector.add(message)
+        if len(self.collector.new_messages) >= self.batch_size:
+            self.flush_messages()
+
+    def output_handlers(self, json_path, name_to_href, skipped_names=None):
+        # only the last lines of the regular output are kept
+        stdout_lines = deque(maxlen=self.max_output_lines)
+        stderr_lines = deque(maxlen=self.max_output_lines)
+        hrefs = set(name_to_href.values())
+        paths = {}
+
+        def process_line(line, output_lines, has_messages):
+            if has_messages and line.startswith(MESSAGE_TYPES):
+                # the JSON report contains the same messages
+                if json_path is not None:
+                    return
+                # messages that the check profile doesn't keep aren't parsed
+                if self.message_filter is not None and not self.message_filter.accepts(line):
+                    return
+                message = parse_line(line, name_to_href, hrefs, paths)
+                if message is not None:
+                    self.collect(message, skipped_names)
+                    return
+            output_lines.append(line)
+
+        # usage messages are written to stdout!
+        on_stdout_line = lambda line: process_line(line, stdout_lines, self.usage)
+        on_stderr_line = lambda line: process_line(line, stderr_lines, True)
+        return stdout_lines, stderr_lines, on_stdout_line, on_stderr_line
+
+    def run_epubcheck(self, epc_args, result):
+        # run epubcheck
+        self.status_changed.emit('Running EPUBCheck...')
+        returncode = None
+        text_args = epc_args
+        epc_args, json_path = self.prepare_run(epc_args)
+        name_to_href = self.run_name_to_href(text_args)
+        skipped_names = self.run_skipped_names(text_args)
+        stdout_lines, stderr_lines, on_stdout_line, on_stderr_line = self.output_handlers(json_path, name_to_href, skipped_names)
+
+        # reuse the persistent EPUBCheck JVM, if enabled
+        start = time.time()
+        jvm_stats = {}
+        if self.daemon:
+            try:
+                self.running_daemon = get_daemon(self.jvm_args, os.path.dirname(self.epc_path), self.daemon_idle_timeout)
+                with self.timings.span('EPUBCheck daemon'):
+                    ret, returncode = self.running_daemon.check(epc_args)
+                self.used_daemon = True
+                for line in ret[0].decode('utf-8', 'replace').splitlines():
+                    on_stdout_line(line)
+                for line in ret[1].decode('utf-8', 'replace').splitlines():
+                    on_stderr_line(line)
+            except DaemonError as e:
+                # fall back to a one-shot EPUBCheck run
+                print(e)
+                shutdown_daemon()
+                returncode = None
+            finally:
+                self.running_daemon = None
+        else:
+            shutdown_daemon()
+
+        if self.cancelled:
+            return False
+        if returncode is None:
+            # wait for a free JVM, e.g. while queued books are checked
+            if not jvm_slots.acquire(lambda: self.cancelled):
+                return False
+            try:
+                with self.timings.span('EPUBCheck (Java)'):
+                    returncode = streamingJarWrapper(self.oneshot_jvm_args + ['-jar', self.epc_path] + epc_args, on_stdout_line, on_stderr_line,
+                                                     started=self.process_started, stats=jvm_stats)
+            finally:
+                jvm_slots.release()
+            if 'peak_rss_bytes' in jvm_stats:
+                self.timings.count('java_peak_rss_bytes', max(self.timings.counters.get('java_peak_rss_bytes', 0), jvm_stats['peak_rss_bytes']))
+        self.jvm_seconds += time.time() - start
+        if self.cancelled:
+            return False
+        return self.finish_run(text_args, json_path, name_to_href, skipped_names, returncode, stdout_lines, stderr_lines, result)
+
+    def run_parallel(self, runs, result):
+        # check independent files on a pool of EPUBCheck JVMs; returns False if the pool couldn't be used
+        # or failed, the files are checked one by one then
+        # the pool's JVMs count against the shared JVM budget
+        jobs = min(self.parallel_jobs, len(runs), jvm_slots.size)
+        if jobs < 2:
+            return False
+        self.status_changed.emit('Starting {} EPUBCheck JVMs...'.format(jobs))
+        self.running_pool = DaemonPool(self.jvm_args, os.path.dirname(self.epc_path), jobs)
+        start = time.time()
+        try:
+            with self.timings.span('EPUBCheck JVM pool startup'):
+                self.running_pool.start()
+        except DaemonError as e:
+            # e.g. Java 8, which can't run the daemon
+            print('EPUBCheck parallel mode not available:', e)
+            self.running_pool = None
+            return False
+
+        prepared = [self.prepare_run(epc_args) + (epc_args,) for epc_args in runs]
+        if self.book_run:
+            self.split_names = set(self.file_names.values())
+        done = 0
+        try:
+            with self.timings.span('EPUBCheck (parallel)'):
+                for i, ret, returncode in self.running_pool.imap([epc_args for epc_args, json_path, text_args in prepared]):
+                    epc_args, json_path, text_args = prepared[i]
+                    name_to_href = self.run_name_to_href(text_args)
+                    skipped_names = self.run_skipped_names(text_args)
+                    stdout_lines, stderr_lines, on_stdout_line, on_stderr_line = self.output_handlers(json_path, name_to_href, skipped_names)
+                    for line in ret[0].decode('utf-8', 'replace').splitlines():
+                        on_stdout_line(line)
+                    for line in ret[1].decode('utf-8', 'replace').splitlines():
+                        on_stderr_line(line)
+                    if self.cancelled or not self.finish_run(text_args, json_path, name_to_href, skipped_names, returncode, stdout_lines, stderr_lines, result):
+                        return True
+                    done += 1
+                    self.status_changed.emit('Finished {:,} of {:,} EPUBCheck runs...'.format(done, len(runs)))
+        except DaemonError as e:
+            if self.cancelled:
+                return True
+            # e.g. a crashed JVM: the partial result is discarded and the files are checked again one by one
+            print('EPUBCheck parallel check failed:', e)
+            self.discard_result(result)
+            return False
+        finally:
+            self.running_pool.stop()
+            self.running_pool = None
+            self.jvm_seconds += time.time() - start
+            self.used_daemon = True
+        return True
+
+    def discard_result(self, result):
+        # the dock only keeps the messages of the previous check and the pre-flight checks
+        result.update({'stdout': '', 'stderr': '', 'returncode': None})
+        self.split_names = set()
+        self.collector = MessageCollector(self.collector.max_messages, self.collector.max_duplicates)
+        self.messages_cleared.emit()
+        if self.cached_messages:
+            self.emit_messages(self.cached_messages)
+        self.emit_messages(self.preflight_messages)
+
+    def finish_run(self, text_args, json_path, name_to_href, skipped_names, returncode, stdout_lines, stderr_lines, result):
+        # older EPUBCheck versions don't support --json; run them again with text output
+        report = read_json_report(json_path) if json_path is not None else None
+        if json_path is not None and report is None and returncode != 0:
+            print('No EPUBCheck JSON report found, falling back to text output.')
+            self.json_output = False
+            return self.run_epubcheck(text_args, result)
+
+        stdout = '\n'.join(stdout_lines)
+        stderr = '\n'.join(stderr_lines)
+        result['stdout'] += stdout
+        result['stderr'] += stderr
+        result['returncode'] = max(result['returncode'] or 0, returncode)
+
+        # check for Java errors
+        if returncode == 1 and 'java.lang.' in stderr:
+            result['returncode'] = returncode
+            result['stdout'] = stdout
+            result['stderr'] = stderr
+            return False
+
+        #--------------------------------------------
+        # process the JSON report
+        #--------------------------------------------
+        if report is not None:
+            self.status_changed.emit('Parsing EPUBCheck messages...')
+            with self.timings.span('parse JSON report'):
+                for message in parse_json_report(report, name_to_href, self.message_filter):
+                    if self.cancelled:
+                        return False
+                    self.collect(message, skipped_names)
+        self.flush_messages()
+        return True
+
+    def flush_messages(self):
+        # send the new messages to the dock
+        new_messages = self.collector.take_new_messages()
+        if new_messages:
+            self.messages_found.emit(new_messages)
+
+    def emit_messages(self, messages):
+        # send the messages to the dock in batches
+        batch = []
+        for error_msg in messages:
+            if self.cancelled:
+                return False
+            batch.append(error_msg)
+            if len(batch) >= self.batch_size:
+                self.messages_found.emit(batch)
+                batch = []
+        if batch:
+            self.messages_found.emit(batch)
+        return True
+
+class UpdateJob(QObject):
+    '''
+    Checks for EPUBCheck updates, or downloads and installs an update, in a background thread.
+    '''
+
+    finished = pyqtSignal(object)
+
+    def __init__(self, epubcheck_dir, release_cache, epc_missing=False, release=None):
+        QObject.__init__(self)
+        self.epubcheck_dir = epubcheck_dir
+        self.release_cache = release_cache
+        self.epc_missing = epc_missing
+        self.release = release
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.run, name='EPUBCheckUpdate')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        result = {'message': '', 'release': None, 'update_available': False, 'installed': False, 'epc_missing': self.epc_missing}
+        timings = Timings()
+        try:
+            if self.release is None:
+                # get current epubcheck version from epubcheck.jar
+                epc_version = get_epc_version(os.path.join(self.epubcheck_dir, 'epubcheck.jar'))
+
+                # get latest version and browser download url
+                with timings.span('fetch_latest_release'):
+                    release = fetch_latest_release(self.release_cache)
+                result['release'] = release
+                print('epc_version', epc_version, 'latest_version:', release['latest_version'], 'browser_download_url:', release['download_url'])
+
+                # only run the update if a new version is available
+                if release['latest_version'] != epc_version:
+                    result['update_available'] = True
+                else:
+                    result['message'] = 'No new EPUBCheck version found.'
+            else:
+                # release the files held by the persistent EPUBCheck JVM before they're replaced
+                with timings.span('download_and_install'):
+                    download_and_install(self.release, self.epubcheck_dir, before_install=shutdown_daemon)
+                result['release'] = self.release
+                result['installed'] = True
+                result['message'] = 'EPUBCheck updated to EPUBCheck {}'.format(self.release['latest_version'])
+        except UpdateError as e:
+            result['message'] = str(e)
+        except Exception:
+            import traceback
+            result['message'] = 'Internal error: update check failed.'
+            traceback.print_exc()
+        timings.stop()
+        result['timings'] = timings.to_dict()
+        self.finished.emit(result)
+
+class EpubCheckController(object):
+    '''
+    Runs the checks of the tool and shows their results in the EPUBCheck dock.
+    '''
+
+    # the running background check
+    worker = None
+
+    # the last and the running check, used for incremental checks
+    last_check = None
+    pending_check = None
+
+    # why the running check doesn't cover the whole book: None or 'files' (changed files only),
+    # and the container names of the checked files of a partial check
+    partial_check = None
+    checked_names = None
+
+    # the running update check or download
+    update_job = None
+    run_after_update = False
+
+    # the timing spans of the last check
+    timings = Timings()
+
+    # watch mode: the dock is updated after saves and edits
+    dock_widget = None
+    watching = False
+    watch_run = False
+    watch_pending = False
+    watch_timer = None
+    watch_delay = 2000
+    watched_editors = None
+
+    # the running AppCDS archive job and the timing of the running check ('fast_start' or 'default')
+    archive_thread = None
+    archive_attempt = None
+    timing_mode = None
+
+    # the check results of all books, opened on first use
+    history = None
+
+    # the result cache of the last check; None if it's disabled
+    result_cache = None
+
+    # the check profile of the last check; None for the first (full) profile
+    check_profile = None
+
+    # whether the folders of earlier checks were removed
+    runs_cleaned = False
+
+    # the book key and the {name: (fingerprint, messages)} pre-flight results of its XML files
+    preflight_cache = None
+
+    # checks of other books: the queue, {path: {'state': ..., 'book': ..., 'model': ...}} and the dock tabs
+    book_queue = None
+    queued_books = None
+    book_tabs = None
+
+    def __init__(self, tool):
+        self.tool = tool
+        self.queued_books = {}
+        self.book_tabs = {}
+
+    @property
+    def gui(self):
+        return self.tool.gui
+
+    @property
+    def boss(self):
+        return self.tool.boss
+
+    @property
+    def current_container(self):
+        return self.tool.current_container
+
+    def init_watch(self):
+        prefs = get_prefs()
+        self.set_watch(prefs.get('watch', False), prefs.get('watch_delay', 2000))
+
+    def set_watch(self, enabled, delay=None):
+        # re-check the book after saves and edits
+        self.watching = bool(enabled)
+        if delay is not None:
+            self.watch_delay = delay
+        if not self.watching:
+            if self.watch_timer is not None:
+                self.watch_timer.stop()
+            return
+        if self.watch_timer is None:
+            # bursts of saves and edits are merged into one check
+            self.watch_timer = QTimer(self.gui)
+            self.watch_timer.setSingleShot(True)
+            self.watch_timer.timeout.connect(self.watch_check)
+            self.watched_editors = weakref.WeakSet()
+            save_manager = getattr(self.boss, 'save_manager', None)
+            if save_manager is not None and hasattr(save_manager, 'save_done'):
+                save_manager.save_done.connect(self.schedule_watch_check)
+        self.watch_editors()
+
+    def watch_editors(self):
+        # editors opened since the last check
+        for editor in list(editors.values()):
+            if editor not in self.watched_editors:
+                editor.data_changed.connect(self.schedule_watch_check)
+                self.watched_editors.add(editor)
+
+    def toggle_watch(self, checked):
+        prefs = get_prefs()
+        prefs.set('watch', checked)
+        self.set_watch(checked, prefs.get('watch_delay', 2000))
+
+    def schedule_watch_check(self, *args):
+        if self.watching:
+            self.watch_timer.start(self.watch_delay)
+
+    def watch_check(self):
+        # don't start a check while one is running, run it afterwards
+        if self.worker is not None and self.worker.is_alive():
+            self.watch_pending = True
+            return
+        self.watch_editors()
+        self.ask_user(watch=True)
+
+    def check_for_updates(self, epc_missing=False):
+        if self.update_job is not None and self.update_job.is_alive():
+            return
+        prefs = get_prefs()
+
+        # compare current date against last update check date
+        if not epc_missing:
+            if not prefs.get('github', True):
+                return
+            last_time_checked = prefs.get('last_time_checked', str(datetime.now() - timedelta(days=7)))
+            time_delta = (datetime.now() - string_to_date(last_time_checked)).days
+            if time_delta < prefs.get('check_interval', 7):
+                return
+
+        epubcheck_dir = os.path.join(config_dir, 'plugins', 'EPUBCheck')
+        if not os.path.isdir(epubcheck_dir):
+            os.makedirs(epubcheck_dir)
+        self.update_job = UpdateJob(epubcheck_dir, prefs.get('release_cache', {}), epc_missing)
+        self.update_job.finished.connect(self.update_finished)
+        self.update_job.start()
+
+    def update_finished(self, result):
+        prefs = get_prefs()
+        release = result['release']
+
+        # append the timings of the update check to the rolling log file
+        if prefs.get('timing_log', False):
+            record = result['timings']
+            record['update'] = result['message'] or 'update available'
+            append_log(os.path.join(config_dir, 'plugins', 'EPUBCheck', 'timings.log'), record)
+
+        # update time stamp and cached release information in EpubCheck.json
+        if release is not None:
+            prefs.set('last_time_checked', str(datetime.now()))
+            prefs.set('release_cache', release)
+            prefs.commit()
+
+        if result['update_available']:
+            if not result['epc_missing']:
+                answer = QMessageBox.question(self.gui, "EPUBCheck update available", "EPUBCheck {} is available.\nDo you want to download the latest version?".format(release['latest_version']))
+                if answer != QMessageBox.StandardButton.Yes:
+                    return
+
+            # download and install EPUBCheck in the background
+            self.gui.show_status_message("Downloading {}...".format(release['download_url']), 3)
+            self.update_job = UpdateJob(self.update_job.epubcheck_dir, release, result['epc_missing'], release)
+            self.update_job.finished.connect(self.update_finished)
+            self.update_job.start()
+            return
+
+        # display update status messages
+        self.gui.show_status_message(result['message'], 5 if result['installed'] else 10)
+
+        # the AppCDS archive belongs to the replaced epubcheck.jar
+        if result['installed']:
+            self.update_archive()
+
+        # run the check that was waiting for the EPUBCheck files
+        if self.run_after_update:
+            self.run_after_update = False
+            if result['installed']:
+                self.ask_user()
+            else:
+                QMessageBox.critical(self.gui, "EPUBCheck Java files missing!", 'Please re-run the plugin while connected to the Internet.\n\n' + result['message'])
+
+    def ask_user(self, watch=False):
+
+        # only run one check at a time
+        if self.worker is not None and self.worker.is_alive():
+            self.gui.show_status_message("EPUBCheck is already running.", 3)
+            return
+        self.watch_run = bool(watch)
+
+        #-----------------------------------
+        # define EPUBCheck paths
+        #-----------------------------------
+        epubcheck_dir = os.path.join(config_dir, 'plugins', 'EPUBCheck')
+        if not os.path.isdir(epubcheck_dir):
+            os.makedirs(epubcheck_dir)
+        epc_path = os.path.join(epubcheck_dir, 'epubcheck.jar')
+        epc_lib_dir = os.path.join(epubcheck_dir, 'lib')
+
+        # check if the EPUBCheck Java files were downloaded
+        if not os.path.isfile(epc_path) or not os.path.isdir(epc_lib_dir):
+            # download EPUBCheck in the background and run the check afterwards
+            self.run_after_update = True
+            self.gui.show_status_message("No EPUBCheck files found. Downloading EPUBCheck...", 7)
+            self.check_for_updates(epc_missing=True)
+            return
+
+        # record the timing spans of this check
+        self.timings = Timings()
+        set_active(self.timings)
+
+        #----------------------------------------
+        # get user preference file
+        #----------------------------------------
+        with self.timings.span('preferences'):
+            prefs = get_prefs()
+
+        #---------------------------
+        # get preferences
+        #---------------------------
+        locale = prefs.get('locale', None)
+        close_cb = prefs.get('close_cb', False)
+        self.clipboard_copy = prefs.get('clipboard_copy', False)
+        usage = prefs.get('usage', False)
+        java_path = prefs.get('java_path', 'java').replace('\\\\', '/').replace('\\', '/')
+        daemon = prefs.get('daemon', False)
+        daemon_idle_timeout = prefs.get('daemon_idle_timeout', 600)
+        incremental = prefs.get('incremental', True)
+        result_cache = prefs.get('result_cache', True)
+        result_cache_size = prefs.get('result_cache_size', 100)
+        json_output = prefs.get('json_output', True)
+        max_messages = prefs.get('max_messages', 10000)
+        max_duplicates = prefs.get('max_duplicates', 10)
+        fast_start = prefs.get('fast_start', False)
+        parallel = prefs.get('parallel', False)
+        parallel_jobs = (prefs.get('parallel_jobs', 0) or os.cpu_count() or 1) if parallel else 1
+        jvm_slots.resize(prefs.get('max_parallel_jvms', 0))
+        parallel_min_files = prefs.get('parallel_min_files', 20)
+        preflight = prefs.get('preflight', True)
+        preflight_skip_java = prefs.get('preflight_skip_java', False)
+        scratch_workspace = prefs.get('scratch_workspace', True)
+        scratch_dir = prefs.get('scratch_dir', None)
+        scratch_max_books = prefs.get('scratch_max_books', 3)
+
+        # the EPUBCheck options and the message filter of the selected check profile
+        profile = get_profile(prefs)
+        try:
+            profile_args, usage, message_filter = profile_options(profile, usage)
+        except ValueError as e:
+            set_active(None)
+            QMessageBox.critical(self.gui, "Invalid check profile", str(e))
+            return
+        self.check_profile = profile.get('name') if profile.get('name') != get_profiles(prefs)[0].get('name') else None
+
+        #-----------------------------------------------------
+        # create a savepoint
+        #----------------------------------------------------
+        if not self.watch_run:
+            self.boss.add_savepoint('Before: EPUBCheck')
+
+        #--------------------------------------------------------------------
+        # create a dictionary that maps names to relative hrefs
+        #--------------------------------------------------------------------
+        epub_name_to_href = make_name_to_href(self.current_container.mime_map)
+
+
+        #-------------------------------------
+        # assemble epubcheck parameters
+        #-------------------------------------
+
+        # Java and EPUBCheck are only probed again if they were changed
+        env = get_environment(prefs, java_path, epc_path)
+        self.epc_version = env['epc_version']
+        jvm_args, epc_args = build_args(java_path, env['is32bit'], locale)
+        epc_args += profile_args
+
+        #--------------------------------------------------------------------
+        # compare the book with the last check
+        #--------------------------------------------------------------------
+        with self.timings.span('commit editors'):
+            self.boss.commit_all_editors_to_container()
+        book_key = self.current_container.path_to_ebook
+        try:
+            jar_stat = os.stat(epc_path)
+            options_key = (tuple(jvm_args), tuple(epc_args), jar_stat.st_size, jar_stat.st_mtime, parallel,
+                           tuple(message_filter.key()) if message_filter is not None else None)
+        except OSError:
+            options_key = None
+        with self.timings.span('fingerprint book'):
+            fingerprints = fingerprint_container(self.current_container)
+        if incremental:
+            plan, files = plan_check(self.last_check, book_key, options_key, fingerprints, self.current_container)
+        else:
+            plan, files = 'full', []
+        self.pending_check = CheckState(book_key, options_key, fingerprints, [])
+        self.create_dock(close_cb)
+
+        # JVM options of one-shot runs, sized for the book
+        oneshot_jvm_args = jvm_args
+        if fast_start:
+            try:
+                size = os.path.getsize(book_key)
+            except (OSError, TypeError):
+                size = 0
+            oneshot_jvm_args = fast_start_args(jvm_args, get_tuning_args(prefs, env, java_path, size), env['java_version'], epc_path)
+
+        # checks of single files don't report cross-file problems; their results aren't added to the history
+        self.partial_check = None
+        self.checked_names = None
+        if plan == 'files' or (plan == 'cached' and self.last_check.partial):
+            self.partial_check = 'files'
+            self.pending_check.partial = True
+        if plan == 'files':
+            self.checked_names = set(name for name, mode in files)
+
+        # only compare the wall-clock times of full one-shot checks
+        self.timing_mode = None
+        if plan == 'full' and not daemon:
+            self.timing_mode = 'fast_start' if fast_start else 'default'
+
+        # nothing changed: reuse the previous results
+        if plan == 'cached':
+            self.add_messages(self.last_check.messages)
+            self.check_finished({'stdout': self.last_check.stdout, 'stderr': '', 'returncode': self.last_check.returncode, 'error': None, 'cancelled': False, 'cached': True})
+            self.set_status('No files changed since the last check.')
+            return
+
+        # the pre-flight results of unchanged files are reused
+        if self.preflight_cache is None or self.preflight_cache[0] != book_key:
+            self.preflight_cache = (book_key, {})
+
+        # the folders of crashed checks are removed once per session
+        if not self.runs_cleaned:
+            cleanup_runs()
+            self.runs_cleaned = True
+        temp_dir = tempfile.mkdtemp(prefix=RUN_PREFIX)
+        workspace = None
+        book_run = False
+        if plan == 'files':
+            #--------------------------------------------------------------------
+            # copy the changed content documents, they'll be checked on their own
+            #--------------------------------------------------------------------
+            container = None
+            check_files = []
+            for i, (name, mode) in enumerate(files):
+                file_dir = os.path.join(temp_dir, str(i))
+                os.mkdir(file_dir)
+                file_path = os.path.join(file_dir, os.path.basename(name))
+                shutil.copyfile(self.current_container.name_to_abspath(name), file_path)
+                check_files.append((file_path, mode, name))
+            # the pre-flight messages of the changed files are replaced, too
+            cached_messages = merge_messages(self.last_check.messages, [name for name, mode in files], [])
+        else:
+            #--------------------------------------------------------------------
+            # copy the current container, it'll be written to disk in the background;
+            # the copy uses hard links, so only modified files are written
+            #--------------------------------------------------------------------
+            container_dir = os.path.join(temp_dir, 'book')
+            os.mkdir(container_dir)
+            with self.timings.span('clone_container'):
+                container = clone_container(self.current_container, container_dir)
+            check_files = None
+            cached_messages = None
+
+            # check the package document, the navigation document and the content documents of large books on their own, in parallel;
+            # the whole book is checked alongside them for the container, CSS and cross-file checks
+            if parallel_jobs > 1:
+                parallel_files = plan_parallel_check(container)
+                if len(parallel_files) >= parallel_min_files:
+                    check_files = [(container.name_to_abspath(name), mode, name) for name, mode in parallel_files]
+                    book_run = True
+                    self.timing_mode = None
+
+            # the epub copy of the book is kept between checks, unless calibre has to obfuscate fonts when it writes the book
+            if scratch_workspace and container is not None and book_key and self.current_container.book_type == 'epub' \
+                    and not getattr(self.current_container, 'obfuscated_fonts', None):
+                try:
+                    root = scratch_root(scratch_dir, book_size(book_key) if os.path.exists(book_key) else 0)
+                    workspace = Workspace(root, book_key).open()
+                    cleanup_workspaces(root, scratch_max_books, current=workspace.path)
+                except OSError as e:
+                    print('EPUBCheck workspace not available:', e)
+                    workspace = None
+        epub_version = '3.0' if self.current_container.opf_version_parsed.major >= 3 else '2.0'
+        self.result_cache = ResultCache(os.path.join(epubcheck_dir, 'cache'), result_cache_size * 1024 * 1024) if result_cache else None
+
+        #--------------------------------------------
+        # run epubcheck in a background thread
+        #--------------------------------------------
+        self.worker = EpubCheckWorker(container, temp_dir, jvm_args, epc_path, epc_args, epub_name_to_href,
+                                      usage=usage, daemon=daemon, daemon_idle_timeout=daemon_idle_timeout,
+                                      check_files=check_files, cached_messages=cached_messages, epub_version=epub_version,
+                                      result_cache=self.result_cache,
+                                      json_output=json_output, max_messages=max_messages, max_duplicates=max_duplicates,
+                                      epc_version=self.epc_version, oneshot_jvm_args=oneshot_jvm_args,
+                                      timings=self.timings, parallel_jobs=parallel_jobs, message_filter=message_filter,
+                                      workspace=workspace, preflight=preflight, preflight_skip_java=preflight_skip_java,
+                                      fingerprints=fingerprints, preflight_cache=self.preflight_cache[1], book_run=book_run)
+        self.worker.messages_found.connect(self.add_messages)
+        self.worker.messages_cleared.connect(self.clear_messages)
+        self.worker.status_changed.connect(self.set_status)
+        self.worker.finished.connect(self.check_finished)
+        self.worker.start()
+        if plan == 'files':
+            self.set_status('Checking {} changed file(s)...'.format(len(check_files)))
+
+    def create_dock(self, close_cb):
+        # watch mode updates the existing dock in place
+        if self.watch_run and self.dock_widget is not None and self.dock_widget.parent() is self.gui:
+            self.reset_dock()
+            return
+
+        #------------------------------------------------------------------------------------------------
+        # remove existing EPUBCheck/FlightCrew docks and close Check Ebook dock
+        #------------------------------------------------------------------------------------------------
+        for widget in self.gui.children():
+            if isinstance(widget, QDockWidget) and widget.objectName() == 'epubcheck-dock':
+                #self.gui.removeDockWidget(widget)
+                #widget.close()
+                widget.setParent(None)
+            if isinstance(widget, QDockWidget) and widget.objectName() == 'check-book-dock' and close_cb == True:
+                widget.close()
+
+        #----------------------------------
+        # define dock widget layout
+        #----------------------------------
+        try:
+            self.is_dark_theme = QApplication.instance().is_dark_theme
+        except:
+            self.is_dark_theme = False
+        self.model = MessageModel(self.is_dark_theme)
+        prefs = get_prefs()
+        group_modes = [mode for label, mode in GROUP_MODES]
+        group_mode = prefs.get('group_mode', 'problem')
+        if group_mode not in group_modes:
+            group_mode = None
+        self.model.set_grouping(group_mode, prefs.get('group_locations', 50))
+        self.listView = QListView()
+        self.listView.setUniformItemSizes(True)
+        self.listView.setModel(self.model)
+        self.listView.clicked.connect(self.GotoLine)
+
+        # filter and sort controls
+        self.severity_box = QComboBox()
+        for label, severities in SEVERITY_FILTERS:
+            self.severity_box.addItem(label)
+        self.severity_box.currentIndexChanged.connect(self.filter_messages)
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText('Filter by message ID or file name')
+        self.filter_edit.textChanged.connect(self.filter_messages)
+        self.sort_box = QComboBox()
+        for label, sort_key in SORT_KEYS:
+            self.sort_box.addItem('Sort by: ' + label)
+        self.sort_box.currentIndexChanged.connect(self.sort_messages)
+        self.group_box = QComboBox()
+        for label, mode in GROUP_MODES:
+            self.group_box.addItem(label)
+        self.group_box.setCurrentIndex(group_modes.index(group_mode))
+        self.group_box.currentIndexChanged.connect(self.group_messages)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.severity_box)
+        self.change_box = QComboBox()
+        for label, change in CHANGE_FILTERS:
+            self.change_box.addItem(label)
+        self.change_box.setToolTip('Changes since the last check of the book')
+        self.change_box.currentIndexChanged.connect(self.filter_changes)
+        filter_layout.addWidget(self.change_box)
+        filter_layout.addWidget(self.filter_edit, 1)
+        filter_layout.addWidget(self.sort_box)
+        filter_layout.addWidget(self.group_box)
+        self.watch_box = QCheckBox('Re-check on save')
+        self.watch_box.setToolTip('Check the changed files again after saves and edits')
+        self.watch_box.setChecked(self.watching)
+        self.watch_box.toggled.connect(self.toggle_watch)
+        filter_layout.addWidget(self.watch_box)
+
+        self.textbox = QTextEdit()
+        self.textbox.setVisible(False)
+        self.status_label = QLabel('Running EPUBCheck...')
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.clicked.connect(self.cancel_check)
+        self.timing_button = QToolButton()
+        self.timing_button.setText('Timings')
+        self.timing_button.setCheckable(True)
+        self.timing_button.setAutoRaise(True)
+        self.timing_button.setArrowType(Qt.RightArrow)
+        self.timing_button.setToolButtonStyle(Qt.ToolButtonTextBesideIcon)
+        self.timing_button.setEnabled(False)
+        self.timing_button.toggled.connect(self.toggle_timings)
+        self.timing_label = QLabel()
+        self.timing_label.setStyleSheet('font-family: monospace')
+        self.timing_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.timing_label.setVisible(False)
+        status_layout = QHBoxLayout()
+        status_layout.addWidget(self.timing_button)
+        status_layout.addWidget(self.status_label, 1)
+        status_layout.addWidget(self.progress_bar)
+        status_layout.addWidget(self.cancel_button)
+        self.profile_box = QComboBox()
+        profile_names = [profile.get('name') for profile in get_profiles(get_prefs())]
+        self.profile_box.addItems(profile_names)
+        self.profile_box.setCurrentIndex(profile_names.index(get_profile(get_prefs()).get('name')))
+        self.profile_box.setToolTip('Check profile of the next checks')
+        self.profile_box.currentIndexChanged.connect(self.select_profile)
+        status_layout.addWidget(self.profile_box)
+        self.queue_button = QPushButton('Check more books...')
+        self.queue_button.setToolTip('Check recently edited books or other epub files in the background')
+        self.queue_button.clicked.connect(self.queue_books)
+        status_layout.addWidget(self.queue_button)
+        self.clear_cache_button = QPushButton('Clear cache')
+        self.clear_cache_button.setToolTip('Delete the cached EPUBCheck results of all books')
+        self.clear_cache_button.clicked.connect(self.clear_cache)
+        status_layout.addWidget(self.clear_cache_button)
+
+        # the current book and the queued books have their own tabs
+        book_layout = QVBoxLayout()
+        book_layout.setContentsMargins(0, 0, 0, 0)
+        book_layout.addWidget(self.listView)
+        book_layout.addWidget(self.textbox)
+        book_contents = QWidget()
+        book_contents.setLayout(book_layout)
+        self.tabs = QTabWidget()
+        self.tabs.setTabBarAutoHide(True)
+        self.tabs.setTabsClosable(True)
+        self.tabs.tabCloseRequested.connect(self.close_book_tab)
+        self.tabs.addTab(book_contents, os.path.basename(self.current_container.path_to_ebook or '') or 'Current book')
+        self.tabs.tabBar().setTabButton(0, QTabBar.RightSide, None)
+        self.tabs.tabBar().setTabButton(0, QTabBar.LeftSide, None)
+        self.book_tabs = {}
+        for path in self.queued_books:
+            self.show_book(path)
+
+        l = QVBoxLayout()
+        l.addLayout(filter_layout)
+        l.addWidget(self.tabs)
+        l.addLayout(status_layout)
+        l.addWidget(self.timing_label)
+        dock_contents = QWidget()
+        dock_contents.setLayout(l)
+        dock_widget = QDockWidget(self.gui)
+        dock_widget.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.BottomDockWidgetArea | Qt.TopDockWidgetArea)
+        dock_widget.setObjectName('epubcheck-dock')
+        dock_widget.setWindowTitle('EPUBCheck')
+        dock_widget.setWidget(dock_contents)
+
+        # add dock widget to the dock
+        self.gui.addDockWidget(Qt.TopDockWidgetArea, dock_widget)
+        self.dock_widget = dock_widget
+
+    def reset_dock(self):
+        # clear the messages, but keep the filter, sort order and dock position
+        self.model.set_messages([])
+        self.listView.setVisible(True)
+        self.textbox.setVisible(False)
+        self.progress_bar.setVisible(True)
+        self.cancel_button.setVisible(True)
+        self.cancel_button.setEnabled(True)
+        self.status_label.setText('Running EPUBCheck...')
+
+    def set_status(self, message):
+        self.status_label.setText(message)
+        self.gui.show_status_message(message, 3)
+
+    def cancel_check(self):
+        if self.worker is not None:
+            self.set_status('Cancelling EPUBCheck...')
+            self.cancel_button.setEnabled(False)
+            self.worker.cancel()
+
+    def toggle_timings(self, checked):
+        # show or hide the timing footer
+        self.timing_button.setArrowType(Qt.DownArrow if checked else Qt.RightArrow)
+        self.timing_label.setVisible(checked)
+
+    def show_timings(self):
+        # stop recording and show the timing spans in the dock footer
+        set_active(None)
+        self.timings.stop()
+        self.timings.count('dock_rows', len(self.model.messages))
+        self.timing_label.setText(self.timings.summary())
+        self.timing_button.setEnabled(True)
+
+        # append the timings to the rolling log file
+        if get_prefs().get('timing_log', False):
+            record = self.timings.to_dict()
+            record['epubcheck'] = self.epc_version
+            record['book'] = os.path.basename(self.current_container.path_to_ebook or '')
+            append_log(os.path.join(config_dir, 'plugins', 'EPUBCheck', 'timings.log'), record)
+
+    def add_messages(self, messages):
+        # add error messages to the list model
+        with self.timings.span('dock'):
+            self.model.add_messages(messages)
+        self.status_label.setText('{:,} messages...'.format(len(self.model.messages)))
+
+    def clear_messages(self):
+        # the check starts again, e.g. after the JVM pool of a parallel check failed
+        self.model.set_messages([])
+
+    def models(self):
+        # the models of the current book and the checked queued books
+        return [self.model] + [entry['model'] for entry in self.queued_books.values() if entry['model'] is not None]
+
+    def filter_messages(self):
+        severities = SEVERITY_FILTERS[self.severity_box.currentIndex()][1]
+        for model in self.models():
+            model.set_filter(severities, self.filter_edit.text())
+
+    def filter_changes(self):
+        for model in self.models():
+            model.set_change_filter(CHANGE_FILTERS[self.change_box.currentIndex()][1])
+
+    def sort_messages(self):
+        for model in self.models():
+            model.set_sort_key(SORT_KEYS[self.sort_box.currentIndex()][1])
+
+    def group_messages(self):
+        group_mode = GROUP_MODES[self.group_box.currentIndex()][1]
+        get_prefs().set('group_mode', group_mode)
+        for model in self.models():
+            model.set_grouping(group_mode)
+
+    def select_profile(self):
+        get_prefs().set('check_profile', self.profile_box.currentText())
+
+    def clear_cache(self):
+        # the running check can't use the cache any more, it doesn't add its result either
+        if self.worker is not None and self.worker.is_alive():
+            self.gui.show_status_message("EPUBCheck is running, the cache can't be cleared.", 3)
+            return
+        ResultCache(os.path.join(config_dir, 'plugins', 'EPUBCheck', 'cache')).clear()
+        self.set_status('EPUBCheck result cache cleared.')
+
+    def queue_books(self):
+        # check other books in the background, each one gets its own tab
+        dialog = BookChooser(self.gui, self.current_container.path_to_ebook)
+        if dialog.exec() != QDialog.DialogCode.Accepted or not dialog.books():
+            return
+        epc_path = os.path.join(config_dir, 'plugins', 'EPUBCheck', 'epubcheck.jar')
+        if not os.path.isfile(epc_path):
+            QMessageBox.critical(self.gui, "EPUBCheck Java files missing!", 'Please run EPUBCheck on the current book first.')
+            return
+        prefs = get_prefs()
+        java_path = prefs.get('java_path', 'java').replace('\\\\', '/').replace('\\', '/')
+        env = get_environment(prefs, java_path, epc_path)
+        try:
+            profile_args, usage, message_filter = profile_options(get_profile(prefs), prefs.get('usage', False))
+        except ValueError as e:
+            QMessageBox.critical(self.gui, "Invalid check profile", str(e))
+            return
+        jvm_args, epc_args = build_args(java_path, env['is32bit'], prefs.get('locale', None))
+        epc_args += profile_args
+
+        # the queue and the checks of the current book run at most max_parallel_jvms JVMs at a time, by default one per two CPUs
+        jvm_slots.resize(prefs.get('max_parallel_jvms', 0))
+        if self.book_queue is None:
+            self.book_queue = BookQueue(jvm_slots.size)
+            self.book_queue.book_started.connect(self.book_started)
+            self.book_queue.book_finished.connect(self.book_finished)
+        self.book_queue.max_jvms = jvm_slots.size
+        for path in dialog.books():
+            book_jvm_args = jvm_args
+            if prefs.get('fast_start', False):
+                book_jvm_args = fast_start_args(jvm_args, get_tuning_args(prefs, env, java_path, book_size(path)), env['java_version'], epc_path)
+            # a book that is already queued or being checked keeps its check
+            self.book_queue.add(path, book_jvm_args, epc_path, epc_args, usage, prefs.get('json_output', True),
+                                prefs.get('max_messages', 10000), prefs.get('max_duplicates', 10), message_filter)
+            self.queued_books[path] = {'state': self.book_queue.state(path) or 'queued', 'book': None, 'model': None}
+            self.show_book(path)
+
+    def book_started(self, path):
+        if path in self.queued_books:
+            self.queued_books[path]['state'] = 'checking'
+            self.show_book(path)
+
+    def book_finished(self, book):
+        path = book['path']
+        if path not in self.queued_books:
+            return
+        self.queued_books[path].update({'state': 'checked', 'book': book})
+        self.show_book(path)
+        self.gui.show_status_message('EPUBCheck: {} checked.'.format(os.path.basename(path)), 3)
+
+    def show_book(self, path):
+        # create or update the tab of a queued book
+        entry = self.queued_books[path]
+        widget = self.book_tabs.get(path)
+        if widget is None:
+            widget = QWidget()
+            layout = QVBoxLayout()
+            layout.setContentsMargins(0, 0, 0, 0)
+            widget.setLayout(layout)
+            self.book_tabs[path] = widget
+            self.tabs.setTabToolTip(self.tabs.addTab(widget, ''), path)
+        layout = widget.layout()
+        while layout.count():
+            layout.takeAt(0).widget().deleteLater()
+
+        name = os.path.basename(path)
+        book = entry['book']
+        entry['model'] = None
+        if book is None:
+            layout.addWidget(QLabel('Checking...' if entry['state'] == 'checking' else 'Waiting for a free JVM...'))
+            title = '{} ({})'.format(name, entry['state'])
+        elif book['java_error'] is not None or not book['messages']:
+            textbox = QTextEdit()
+            textbox.setReadOnly(True)
+            textbox.setText(book['java_error'] or 'EPUBCheck finished without messages ({:.1f} s).'.format(book['seconds']))
+            layout.addWidget(textbox)
+            title = '{} ({})'.format(name, 'failed' if book['java_error'] is not None else 0)
+        else:
+            # same filter, sort order and grouping as the current book
+            model = MessageModel(self.is_dark_theme)
+            model.set_grouping(GROUP_MODES[self.group_box.currentIndex()][1], get_prefs().get('group_locations', 50))
+            model.set_filter(SEVERITY_FILTERS[self.severity_box.currentIndex()][1], self.filter_edit.text())
+            model.set_change_filter(CHANGE_FILTERS[self.change_box.currentIndex()][1])
+            model.set_sort_key(SORT_KEYS[self.sort_box.currentIndex()][1])
+            model.set_messages(book['messages'])
+            view = QListView()
+            view.setUniformItemSizes(True)
+            view.setModel(model)
+            view.clicked.connect(partial(self.open_book_message, path, model))
+            layout.addWidget(view)
+            entry['model'] = model
+            title = '{} ({:,})'.format(name, len(book['messages']))
+        self.tabs.setTabText(self.tabs.indexOf(widget), title)
+
+    def open_book_message(self, path, model, index):
+        # the messages of other books can't be shown in the editor until the book is opened
+        if model.message(index) is None:
+            model.toggle_group(index)
+            return
+        answer = QMessageBox.question(self.gui, "Open book", "Open {} in the editor?".format(os.path.basename(path)))
+        if answer == QMessageBox.StandardButton.Yes:
+            self.boss.open_book(path=path)
+
+    def close_book_tab(self, index):
+        # the tab of the current book can't be closed
+        for path, widget in list(self.book_tabs.items()):
+            if widget is self.tabs.widget(index):
+                if self.book_queue is not None:
+                    self.book_queue.remove(path)
+                del self.queued_books[path]
+                del self.book_tabs[path]
+                self.tabs.removeTab(index)
+                widget.deleteLater()
+                return
+
+    def check_finished(self, result):
+        self.progress_bar.setVisible(False)
+        self.cancel_button.setVisible(False)
+        self.show_timings()
+        stdout = result['stdout']
+        stderr = result['stderr']
+
+        # run the check that was requested while this one was running
+        if self.watch_pending:
+            self.watch_pending = False
+            self.schedule_watch_check()
+
+        if result['cancelled']:
+            self.set_status('EPUBCheck cancelled.')
+            return
+
+        # display internal plugin errors; checks started by watch mode don't interrupt editing
+        if result['error'] is not None:
+            self.set_status('EPUBCheck failed.')
+            if not self.watch_run:
+                QMessageBox.critical(self.gui, "EPUBCheck failed", result['error'])
+            return
+
+        # check for Java errors
+        if result['returncode'] == 1 and 'java.lang.' in stderr:
+            self.set_status('Fatal Java error.')
+            if not self.watch_run:
+                QMessageBox.critical(self.gui, "Fatal Java error", stdout + '\n' + stderr)
+            return
+
+        # EPUBCheck was skipped after fatal pre-flight errors
+        if result.get('skipped'):
+            self.pending_check = None
+            self.set_status('Pre-flight checks found fatal errors, EPUBCheck was skipped.')
+            return
+
+        # the EPUBCheck results of the checked files replace the pre-flight messages of the same problems
+        if any(reported_by_epubcheck(error_msg) for error_msg in self.model.messages):
+            self.model.set_messages([error_msg for error_msg in self.model.messages if not reported_by_epubcheck(error_msg)])
+
+        # remember the result for incremental checks
+        if self.pending_check is not None:
+            self.pending_check.messages = list(self.model.messages)
+            self.pending_check.stdout = stdout
+            self.pending_check.returncode = result['returncode']
+            self.last_check = self.pending_check
+            self.pending_check = None
+
+        # compare the messages with the last check of the book
+        change_text = self.record_history(result)
+
+        error_messages = self.model.messages
+        if error_messages != []:
+            # update the counts of collapsed duplicate messages
+            self.model.refresh()
+
+            # copy to clipboard
+            if self.clipboard_copy and not self.watch_run:
+                QApplication.clipboard().setText('\n'.join(error_msg.message for error_msg in error_messages))
+            total = sum(error_msg.count for error_msg in error_messages)
+            self.set_status('EPUBCheck found {:,} messages{}{}.{}{}'.format(len(error_messages),
+                ' ({:,} including collapsed duplicates)'.format(total) if total != len(error_messages) else '',
+                ' (cached)' if result['cached'] else '', change_text, self.timing_text(result)))
+        else:
+            # add version info to stdout
+            epubcheck_dir = os.path.join(config_dir, 'plugins', 'EPUBCheck')
+            epc_path = os.path.join(epubcheck_dir, 'epubcheck.jar')
+            version = self.epc_version
+            if os.path.isfile(epc_path) and version != '':
+                version = 'EPUBCheck {}'.format(version)
+                stdout = version + '\n' + stdout
+            if result['returncode'] != 0:
+                stdout += '\n' + stderr
+            self.listView.setVisible(False)
+            self.textbox.setText(stdout)
+            self.textbox.setVisible(True)
+            self.set_status('EPUBCheck finished.' + change_text + self.timing_text(result))
+
+        # create the AppCDS archive for the next check
+        self.update_archive()
+
+    def record_history(self, result):
+        # store the messages in the history and mark the new and fixed messages in the dock
+        prefs = get_prefs()
+        path_key = self.current_container.path_to_ebook
+        if not prefs.get('history', True) or result.get('skipped') or not path_key:
+            return self.partial_text()
+
+        # the results of a partial check that are reused weren't compared with the last check either
+        if self.partial_check is not None and self.checked_names is None:
+            return self.partial_text()
+
+        # books are identified by their unique identifier, so that renamed and moved books keep their history
+        identifier = book_identifier(self.current_container)
+        book_key = 'uid:' + identifier if identifier else path_key
+
+        # the runs of other check profiles are compared with each other
+        if self.check_profile is not None:
+            book_key = '{}|{}'.format(book_key, self.check_profile)
+            path_key = '{}|{}'.format(path_key, self.check_profile)
+        if self.history is None:
+            self.history = History(os.path.join(config_dir, 'plugins', 'EPUBCheck', 'history.sqlite'), prefs.get('history_max_runs', 50))
+        messages = self.model.messages
+        try:
+            # earlier runs were stored by path
+            if book_key != path_key:
+                self.history.rename_book(path_key, book_key)
+            last_run = self.history.last_run(book_key)
+
+            # partial checks and checks started by watch mode are compared with the last check, but not stored
+            if not self.watch_run and self.partial_check is None:
+                self.history.add_run(book_key, self.epc_version, messages, result['returncode'])
+            if last_run is None:
+                return self.partial_text()
+            previous_messages = self.history.messages(last_run[0])
+        except sqlite3.Error as e:
+            print('EPUBCheck history not updated:', e)
+            return self.partial_text()
+
+        if self.checked_names is not None:
+            # only the messages of the checked files are compared, the other messages are kept from the last check
+            checked = self.checked_names
+            statuses, fixed = diff_messages([msg for msg in previous_messages if msg.filepath in checked], [msg for msg in messages if msg.filepath in checked])
+            for msg in messages:
+                if msg.filepath not in checked:
+                    statuses[msg] = 'unchanged'
+        else:
+            statuses, fixed = diff_messages(previous_messages, messages)
+        self.model.set_changes(statuses, fixed)
+        new = sum(1 for status in statuses.values() if status == 'new')
+        return ' {:,} new, {:,} fixed, {:,} unchanged since the last check.{}'.format(new, len(fixed), len(statuses) - new, self.partial_text())
+
+    def partial_text(self):
+        if self.partial_check == 'files':
+            return ' Only the changed files were checked, cross-file messages are from the last full check.'
+        return ''
+
+    def timing_text(self, result):
+        text = self.cache_text()
+
+        # compare the wall-clock time with the last full check in the other mode
+        if self.timing_mode is None or result['cached'] or result.get('daemon') or not result.get('seconds'):
+            return text
+        prefs = get_prefs()
+        timings = dict(prefs.get('timings', {}))
+        timings[self.timing_mode] = [round(result['seconds'], 2), self.current_container.path_to_ebook]
+        prefs.set('timings', timings)
+        other_mode = 'default' if self.timing_mode == 'fast_start' else 'fast_start'
+        labels = {'fast_start': 'with fast start', 'default': 'without fast start'}
+        mode_text = ' {:.1f} s {}'.format(result['seconds'], labels[self.timing_mode])
+        if other_mode in timings:
+            seconds, book_path = timings[other_mode]
+            mode_text += ', last check {}: {:.1f} s{}'.format(labels[other_mode], seconds,
+                '' if book_path == self.current_container.path_to_ebook else ' (' + os.path.basename(book_path) + ')')
+        return mode_text + '.' + text
+
+    def cache_text(self):
+        # the hit rate of the result cache over all checks
+        if self.result_cache is None:
+            return ''
+        stats = self.result_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        if not lookups:
+            return ''
+        return ' Result cache: {:.0%} hits ({:,} of {:,} checks).'.format(stats['hits'] / lookups, stats['hits'], lookups)
+
+    def update_archive(self):
+        # create the AppCDS archive of fast start mode in the background
+        prefs = get_prefs()
+        if not prefs.get('fast_start', False) or (self.archive_thread is not None and self.archive_thread.is_alive()):
+            return
+        epc_path = os.path.join(config_dir, 'plugins', 'EPUBCheck', 'epubcheck.jar')
+        java_path = prefs.get('java_path', 'java').replace('\\\\', '/').replace('\\', '/')
+        if not os.path.isfile(epc_path):
+            return
+        env = get_environment(prefs, java_path, epc_path)
+        if java_major_version(env['java_version']) < 13 or archive_is_current(env['java_version'], epc_path):
+            return
+
+        # don't try again for the same Java and EPUBCheck files if the archive couldn't be created
+        stamp = archive_stamp(env['java_version'], epc_path)
+        if stamp == self.archive_attempt:
+            return
+        self.archive_attempt = stamp
+        jvm_args, epc_args = build_args(java_path, env['is32bit'])
+        jvm_args += get_tuning_args(prefs, env, java_path)
+        self.archive_thread = Thread(target=create_archive, args=(jvm_args, env['java_version'], epc_path), name='EPUBCheckArchive')
+        self.archive_thread.daemon = True
+        self.archive_thread.start()
+
+    #---------------------------------------------------------------
+    # auxiliary routine for loading the file into the editor
+    #---------------------------------------------------------------
+    def GotoLine(self, index):
+        # get error information; clicking a group header expands or collapses it
+        error_msg = self.model.message(index)
+        if error_msg is None:
+            self.model.toggle_group(index)
+            return
+        filepath, line, col = error_msg.filepath, error_msg.line, error_msg.col
+
+        # go to the file
+        if not os.path.basename(filepath).endswith('NA'):
+            if line:
+                self.boss.edit_file(filepath)
+                editor = self.boss.gui.central.current_editor
+                if editor is not None and editor.has_line_numbers:
+                    if col is not None:
+                        editor.editor.go_to_line(int(line), col=int(col) - 1)
+                    else:
+                        editor.current_line = int(line)
+            else:
+                QMessageBox.information(self.gui, "Unknown line number", "EPUBCheck didn't report a line number for this error.")
+        else:
+            QMessageBox.information(self.gui, "Unknown file name", "EPUBCheck didn't report the name of the file that caused this error.")
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# standard libraries
+import os, sys, threading, subprocess
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+iswindows = sys.platform.startswith('win')
+
+# Java source of the persistent EPUBCheck worker; launched with the Java 11+ single-file source launcher
+DAEMON_CLASS = 'EpubCheckDaemon'
+DAEMON_SOURCE = '''\
+import java.io.*;
+import java.nio.charset.StandardCharsets;
+
+public class EpubCheckDaemon {
+    public static void main(String[] argv) throws Exception {
+        PrintStream out = System.out;
+        PrintStream err = System.err;
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        out.print("READY\\n");
+        out.flush();
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            String[] args = line.split("\\t");
+            ByteArrayOutputStream o = new ByteArrayOutputStream();
+            ByteArrayOutputStream e = new ByteArrayOutputStream();
+            System.setOut(new PrintStream(o, true, "UTF-8"));
+            System.setErr(new PrintStream(e, true, "UTF-8"));
+            int rc;
+            try {
+                rc = new com.adobe.epubcheck.tool.EpubChecker().run(args);
+            } catch (Throwable t) {
+                t.printStackTrace(System.err);
+                rc = 1;
+            } finally {
+                System.out.flush();
+                System.err.flush();
+                System.setOut(out);
+                System.setErr(err);
+            }
+            byte[] ob = o.toByteArray();
+            byte[] eb = e.toByteArray();
+            out.print(rc + " " + ob.length + " " + eb.length + "\\n");
+            out.write(ob);
+            out.write(eb);
+            out.flush();
+        }
+    }
+}
+'''
+
+class DaemonError(Exception):
+    pass
+
+def _startupinfo():
+    # stop the windows console popping up every time the prog is run
+    startupinfo = None
+    if iswindows:
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+    return startupinfo
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise DaemonError('EPUBCheck daemon closed its output pipe')
+        data += chunk
+    return data
+
+class JvmSlots(object):
+    '''
+    Limits the number of EPUBCheck JVMs that run checks at the same time: the checks of the current book,
+    of the JVM pool of the parallel mode and of the book queue share one budget.
+    '''
+
+    def __init__(self, size=0):
+        self.condition = threading.Condition()
+        self.used = 0
+        self.resize(size)
+
+    def resize(self, size=0):
+        # by default one JVM per two CPUs
+        with self.condition:
+            self.size = size if size > 0 else max(1, (os.cpu_count() or 2) // 2)
+            self.condition.notify_all()
+
+    def acquire(self, cancelled=None):
+        ''' Waits for a free JVM slot; returns False if cancelled() became true while waiting '''
+        with self.condition:
+            while self.used >= self.size:
+                if cancelled is not None and cancelled():
+                    return False
+                self.condition.wait(0.1)
+            self.used += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.used -= 1
+            self.condition.notify()
+
+# one budget per calibre process
+jvm_slots = JvmSlots()
+
+class EpubCheckDaemon(object):
+    '''
+    A long-lived JVM that keeps EPUBCheck loaded between checks.
+
+    Requests are tab separated EPUBCheck arguments terminated by a newline, replies are a
+    "returncode stdout_length stderr_length" header followed by the raw stdout and stderr bytes.
+    '''
+
+    def __init__(self, jvm_args, epubcheck_dir, idle_timeout=600):
+        self.jvm_args = list(jvm_args)
+        self.epubcheck_dir = epubcheck_dir
+        self.epc_path = os.path.join(epubcheck_dir, 'epubcheck.jar')
+        self.idle_timeout = idle_timeout
+        self.process = None
+        self.lock = threading.RLock()
+        self.idle_timer = None
+        self.cancelled = False
+
+    @property
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def write_source(self):
+        source_path = os.path.join(self.epubcheck_dir, DAEMON_CLASS + '.java')
+        source = DAEMON_SOURCE.encode('utf-8')
+        if not os.path.isfile(source_path) or open(source_path, 'rb').read() != source:
+            with open(source_path, 'wb') as f:
+                f.write(source)
+        return source_path
+
+    def start(self):
+        with self.lock:
+            if self.is_running:
+                return
+            class_path = os.pathsep.join([self.epc_path, os.path.join(self.epubcheck_dir, 'lib', '*')])
+            args = self.jvm_args + ['-cp', class_path, self.write_source()]
+            try:
+                self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL, startupinfo=_startupinfo())
+            except OSError as e:
+                self.process = None
+                raise DaemonError('EPUBCheck daemon could not be started: {}'.format(e))
+            if self.process.stdout.readline().strip() != b'READY':
+                self.stop()
+                raise DaemonError('EPUBCheck daemon failed to start (Java 11 or higher is required)')
+            print('EPUBCheck daemon started, pid:', self.process.pid)
+
+    def stop(self):
+        with self.lock:
+            self.cancel_idle_timer()
+            if self.process is not None:
+                try:
+                    self.process.stdin.close()
+                    self.process.wait(5)
+                except Exception:
+                    self.process.kill()
+                self.process = None
+
+    def cancel(self):
+        ''' Kills a running check from another thread; the JVM is restarted on the next check '''
+        self.cancelled = True
+        process = self.process
+        if process is not None:
+            process.kill()
+
+    def cancel_idle_timer(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+    def reset_idle_timer(self):
+        with self.lock:
+            self.cancel_idle_timer()
+            if self.idle_timeout:
+                self.idle_timer = threading.Timer(self.idle_timeout, self.idle_stop)
+                self.idle_timer.daemon = True
+                self.idle_timer.start()
+
+    def idle_stop(self):
+        # a timer that was cancelled or replaced while it waited for a running check doesn't stop the JVM
+        with self.lock:
+            if self.idle_timer is threading.current_thread():
+                self.idle_timer = None
+                self.stop()
+
+    def _request(self, args):
+        self.start()
+        try:
+            self.process.stdin.write('\t'.join(args).encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().split()
+        except (OSError, ValueError) as e:
+            raise DaemonError('EPUBCheck daemon pipe error: {}'.format(e))
+        if len(header) != 3:
+            raise DaemonError('EPUBCheck daemon returned an invalid reply')
+        returncode, out_len, err_len = [int(x) for x in header]
+        stdout = _read_exactly(self.process.stdout, out_len)
+        stderr = _read_exactly(self.process.stdout, err_len)
+        return (stdout, stderr), returncode
+
+    def check(self, args):
+        ''' Runs EPUBCheck with the given arguments; returns the same ((stdout, stderr), returncode) as jarWrapper '''
+        for arg in args:
+            if '\t' in arg or '\n' in arg:
+                raise DaemonError('EPUBCheck daemon arguments must not contain tabs or line breaks')
+        with self.lock:
+            self.cancel_idle_timer()
+            self.cancelled = False
+            if not jvm_slots.acquire(lambda: self.cancelled):
+                if self.is_running:
+                    self.reset_idle_timer()
+                raise DaemonError('EPUBCheck daemon check cancelled')
+            try:
+                try:
+                    return self._request(args)
+                except DaemonError as e:
+                    if self.cancelled:
+                        self.stop()
+                        raise DaemonError('EPUBCheck daemon check cancelled')
+                    # restart a crashed daemon once
+                    print('Restarting EPUBCheck daemon:', e)
+                    self.stop()
+                    return self._request(args)
+            finally:
+                jvm_slots.release()
+                if self.is_running:
+                    self.reset_idle_timer()
+
+class DaemonPool(object):
+    '''
+    A pool of EPUBCheck JVMs that run independent checks in parallel, e.g. the content
+    documents of a large book in single-file mode. Each check takes one of the shared jvm_slots.
+    '''
+
+    def __init__(self, jvm_args, epubcheck_dir, size):
+        self.daemons = [EpubCheckDaemon(jvm_args, epubcheck_dir, idle_timeout=0) for i in range(max(1, size))]
+        self.cancelled = False
+
+    def start(self):
+        # start the JVMs in parallel; raises DaemonError if one of them can't be started
+        errors = []
+        def start(daemon):
+            try:
+                daemon.start()
+            except DaemonError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=start, args=(daemon,)) for daemon in self.daemons]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.stop()
+            raise errors[0]
+
+    def imap(self, runs):
+        '''
+        Runs EPUBCheck once per argument list and yields (index, (stdout, stderr), returncode)
+        in the order the checks finish.
+        '''
+        tasks = Queue()
+        results = Queue()
+        for i, args in enumerate(runs):
+            tasks.put((i, args))
+
+        def work(daemon):
+            try:
+                while not self.cancelled:
+                    try:
+                        i, args = tasks.get_nowait()
+                    except Empty:
+                        break
+                    try:
+                        ret, returncode = daemon.check(args)
+                    except DaemonError as e:
+                        results.put((i, e, None))
+                        break
+                    results.put((i, ret, returncode))
+            finally:
+                # tell the consumer that this JVM is done
+                results.put(None)
+
+        threads = [threading.Thread(target=work, args=(daemon,)) for daemon in self.daemons[:len(runs)]]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            running = len(threads)
+            while running:
+                item = results.get()
+                if item is None:
+                    running -= 1
+                    continue
+                i, ret, returncode = item
+                if isinstance(ret, DaemonError):
+                    raise ret
+                yield i, ret, returncode
+        finally:
+            self.cancel()
+            for thread in threads:
+                thread.join()
+
+    def cancel(self):
+        ''' Kills the running checks from another thread '''
+        self.cancelled = True
+        for daemon in self.daemons:
+            daemon.cancel()
+
+    def stop(self):
+        for daemon in self.daemons:
+            daemon.stop()
+
+#----------------------------------------
+# one shared daemon per calibre process
+#----------------------------------------
+_daemon = None
+_daemon_key = None
+
+def get_daemon(jvm_args, epubcheck_dir, idle_timeout=600):
+    global _daemon, _daemon_key
+    epc_path = os.path.join(epubcheck_dir, 'epubcheck.jar')
+    try:
+        jar_stat = os.stat(epc_path)
+        jar_key = (jar_stat.st_mtime, jar_stat.st_size)
+    except OSError:
+        jar_key = None
+
+    # restart the daemon if the JVM options changed or epubcheck.jar was updated
+    key = (tuple(jvm_args), epubcheck_dir, jar_key)
+    if _daemon is None or key != _daemon_key:
+        shutdown_daemon()
+        _daemon = EpubCheckDaemon(jvm_args, epubcheck_dir, idle_timeout)
+        _daemon_key = key
+    _daemon.idle_timeout = idle_timeout
+
+    # the idle time starts again, so the JVM isn't stopped before the caller's check
+    if _daemon.is_running:
+        _daemon.reset_idle_timer()
+    return _daemon
+
+def shutdown_daemon():
+    global _daemon, _daemon_key
+    if _daemon is not None:
+        _daemon.stop()
+    _daemon = None
+    _daemon_key = None
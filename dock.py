@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# Qt
+from qt.core import QAbstractListModel, QModelIndex, Qt, QBrush, QColor, QFont
+
+# plugin libraries
+from calibre_plugins.epub_check.grouping import MessageGroups, SEVERITY_ORDER
+
+# severity filters displayed in the dock
+SEVERITY_FILTERS = (
+    ('All messages', None),
+    ('Errors', ('FATAL', 'ERROR')),
+    ('Errors and warnings', ('FATAL', 'ERROR', 'WARNING')),
+    ('Warnings', ('WARNING',)),
+    ('Info and usage', ('INFO', 'USAGE')),
+)
+
+# filters of the changes since the last check of the book
+CHANGE_FILTERS = (
+    ('All changes', None),
+    ('New', 'new'),
+    ('Unchanged', 'unchanged'),
+    ('Fixed', 'fixed'),
+)
+
+# grouping modes displayed in the dock
+GROUP_MODES = (
+    ('No grouping', None),
+    ('Group by problem', 'problem'),
+    ('Group by file', 'file'),
+)
+
+# sort keys displayed in the dock
+SORT_KEYS = (
+    ('EPUBCheck order', None),
+    ('Severity', lambda msg: SEVERITY_ORDER.get(msg.severity, 5)),
+    ('Message ID', lambda msg: msg.err_code[msg.err_code.find('('):]),
+    ('File', lambda msg: (msg.filepath, int(msg.line or 0))),
+)
+
+class MessageModel(QAbstractListModel):
+    '''
+    List model for EPUBCheck messages. Filtering and sorting only change the list of
+    visible rows, the view renders the visible rows on demand.
+
+    The fixed messages of the last check are kept in a separate list, they're only
+    shown by the 'fixed' change filter.
+
+    Grouped messages are shown as one header row per group, followed by the rows of
+    the first messages of the group if it's expanded; rows are (group, message) pairs
+    then, with None as the message of a header.
+    '''
+
+    def __init__(self, is_dark_theme=False, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.messages = []
+        self.rows = []
+        self.severities = None
+        self.filter_text = ''
+        self.sort_key = None
+        self.statuses = {}
+        self.fixed_messages = []
+        self.change = None
+        self.grouping = None
+        self.groups = None
+        self.expanded = set()
+        self.max_locations = 50
+
+        # brushes shared by all rows
+        self.backgrounds = {
+            'FATAL': QBrush(QColor(255, 230, 230)),
+            'ERROR': QBrush(QColor(255, 230, 230)),
+            'WARNING': QBrush(QColor(255, 255, 230)),
+        }
+        self.default_background = QBrush(QColor(224, 255, 255))
+        self.foreground = QBrush(QColor('black')) if is_dark_theme else None
+        self.new_font = QFont()
+        self.new_font.setBold(True)
+        self.fixed_font = QFont()
+        self.fixed_font.setStrikeOut(True)
+
+    def shown_messages(self):
+        return self.fixed_messages if self.change == 'fixed' else self.messages
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        if self.grouping is not None:
+            group, message = self.rows[index.row()]
+            if message is None:
+                return self.group_data(group, role)
+        else:
+            message = self.shown_messages()[self.rows[index.row()]]
+        if role == Qt.DisplayRole:
+            return message.message if self.grouping is None else '      ' + message.message
+        if role == Qt.ToolTipRole:
+            if self.change == 'fixed':
+                return 'Fixed since the last check: ' + message.msg
+            if self.statuses.get(message) == 'new':
+                return 'New since the last check: ' + message.msg
+            return message.msg
+        if role == Qt.FontRole:
+            if self.change == 'fixed':
+                return self.fixed_font
+            if self.statuses.get(message) == 'new':
+                return self.new_font
+            return None
+        if role == Qt.BackgroundRole:
+            return self.backgrounds.get(message.severity, self.default_background)
+        if role == Qt.ForegroundRole:
+            return self.foreground
+        return None
+
+    def group_data(self, group, role):
+        if role == Qt.DisplayRole:
+            return ('\u25be ' if group.key in self.expanded else '\u25b8 ') + group.title
+        if role == Qt.ToolTipRole:
+            return group.file_summary()
+        if role == Qt.BackgroundRole:
+            return self.backgrounds.get(group.severity, self.default_background)
+        if role == Qt.ForegroundRole:
+            return self.foreground
+        return None
+
+    def message(self, index):
+        ''' Returns the message of a row; None for group headers '''
+        if self.grouping is not None:
+            return self.rows[index.row()][1]
+        return self.shown_messages()[self.rows[index.row()]]
+
+    def group_rows(self):
+        rows = []
+        for group in self.groups.groups:
+            rows.append((group, None))
+            if group.key in self.expanded:
+                rows.extend((group, message) for message in group.locations)
+        return rows
+
+    def toggle_group(self, index):
+        ''' Expands or collapses the group of a header row '''
+        row = index.row()
+        group = self.rows[row][0]
+        if group.key in self.expanded:
+            self.expanded.discard(group.key)
+            if group.locations:
+                self.beginRemoveRows(QModelIndex(), row + 1, row + len(group.locations))
+                del self.rows[row + 1:row + 1 + len(group.locations)]
+                self.endRemoveRows()
+        else:
+            self.expanded.add(group.key)
+            if group.locations:
+                self.beginInsertRows(QModelIndex(), row + 1, row + len(group.locations))
+                self.rows[row + 1:row + 1] = [(group, message) for message in group.locations]
+                self.endInsertRows()
+        self.dataChanged.emit(index, index)
+
+    def accepts(self, message):
+        if self.change in ('new', 'unchanged') and self.statuses.get(message) != self.change:
+            return False
+        if self.severities is not None and message.severity not in self.severities:
+            return False
+        if self.filter_text and self.filter_text not in message.err_code.lower() and self.filter_text not in message.filepath.lower():
+            return False
+        return True
+
+    def add_messages(self, messages):
+        first = len(self.messages)
+        self.messages.extend(messages)
+        if self.change == 'fixed':
+            return
+        if self.sort_key is not None:
+            self.update_rows()
+            return
+        if self.grouping is not None:
+            self.add_grouped_messages([message for message in messages if self.accepts(message)])
+            return
+        new_rows = [i for i in range(first, len(self.messages)) if self.accepts(self.messages[i])]
+        if new_rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(new_rows) - 1)
+            self.rows.extend(new_rows)
+            self.endInsertRows()
+
+    def add_grouped_messages(self, messages):
+        # only insert rows, a model reset would scroll the view to the top
+        groups = self.groups
+        first_new = len(groups.groups)
+        sizes = dict((group.key, len(group.locations)) for group in groups.groups if group.key in self.expanded)
+        groups.add(messages)
+
+        # new messages of expanded groups
+        for key, size in sizes.items():
+            group = groups.index[key]
+            if len(group.locations) > size:
+                last = self.rows.index((group, None)) + size
+                new_rows = [(group, message) for message in group.locations[size:]]
+                self.beginInsertRows(QModelIndex(), last + 1, last + len(new_rows))
+                self.rows[last + 1:last + 1] = new_rows
+                self.endInsertRows()
+
+        # new groups
+        new_rows = []
+        for group in groups.groups[first_new:]:
+            new_rows.append((group, None))
+            if group.key in self.expanded:
+                new_rows.extend((group, message) for message in group.locations)
+        if new_rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(new_rows) - 1)
+            self.rows.extend(new_rows)
+            self.endInsertRows()
+
+        # the message counts in the headers
+        if self.rows:
+            self.dataChanged.emit(self.index(0), self.index(len(self.rows) - 1))
+
+    def set_messages(self, messages):
+        self.messages = list(messages)
+        self.statuses = {}
+        self.fixed_messages = []
+        self.update_rows()
+
+    def set_changes(self, statuses, fixed_messages):
+        ''' Sets the {message: 'new' or 'unchanged'} map and the fixed messages of the last check '''
+        self.statuses = statuses
+        self.fixed_messages = list(fixed_messages)
+        self.update_rows()
+
+    def set_change_filter(self, change):
+        self.change = change
+        self.update_rows()
+
+    def set_filter(self, severities=None, filter_text=''):
+        self.severities = severities
+        self.filter_text = filter_text.strip().lower()
+        self.update_rows()
+
+    def set_grouping(self, grouping, max_locations=None):
+        self.grouping = grouping
+        if max_locations is not None:
+            self.max_locations = max_locations
+        self.update_rows()
+
+    def set_sort_key(self, sort_key):
+        self.sort_key = sort_key
+        self.update_rows()
+
+    def update_rows(self):
+        self.beginResetModel()
+        self.rows = self.build_rows()
+        self.endResetModel()
+
+    def build_rows(self):
+        messages = self.shown_messages()
+        if self.grouping is None:
+            rows = [i for i, message in enumerate(messages) if self.accepts(message)]
+            if self.sort_key is not None:
+                # stable sort, messages with the same key stay in EPUBCheck order
+                rows.sort(key=lambda i: self.sort_key(messages[i]))
+            return rows
+
+        # groups are ordered by their first message
+        accepted = [message for message in messages if self.accepts(message)]
+        if self.sort_key is not None:
+            accepted.sort(key=self.sort_key)
+        self.groups = MessageGroups(self.grouping, self.max_locations)
+        self.groups.add(accepted)
+        return self.group_rows()
+
+    def refresh(self):
+        ''' Redraws all rows, e.g. after the counts of collapsed messages changed '''
+        if self.grouping is not None:
+            # the group counts are recounted; the rows stay the same unless messages were added in the meantime
+            rows = self.build_rows()
+            if len(rows) != len(self.rows):
+                self.beginResetModel()
+                self.rows = rows
+                self.endResetModel()
+                return
+            self.rows = rows
+        if self.rows:
+            self.dataChanged.emit(self.index(0), self.index(len(self.rows) - 1))
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# "fast start" JVM options for one-shot EPUBCheck runs: an AppCDS archive of the EPUBCheck
+# classes plus heap, JIT and GC options sized for the book
+
+# standard libraries
+import os, re, json, shutil, zipfile, tempfile
+
+try:
+    from calibre_plugins.epub_check.checker import jarWrapper, file_stamp
+except ImportError:
+    from checker import jarWrapper, file_stamp
+
+# name of the class data sharing archive in the EPUBCheck folder
+ARCHIVE_NAME = 'epubcheck.jsa'
+
+# books up to this size (MB) are checked with the C1 compiler only
+C1_ONLY_MAX_SIZE = 20
+
+# get the major Java version, e.g. 8 for 1.8.0_292 or 17 for 17.0.2; 0 if unknown
+def java_major_version(java_version):
+    match = re.match(r'(\d+)(?:\.(\d+))?', java_version or '')
+    if match is None:
+        return 0
+    major = int(match.group(1))
+    if major == 1 and match.group(2):
+        major = int(match.group(2))
+    return major
+
+# get the size of a book file or an unpacked book folder in bytes
+def book_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return size
+
+# heap, JIT and GC options for a short EPUBCheck run
+def tuning_args(java_version, size=0, is32bit=False):
+    if java_major_version(java_version) < 8:
+        return []
+    size_mb = size // (1024 * 1024)
+
+    # EPUBCheck keeps the parsed documents of the book in memory
+    max_heap = min(max(512, 256 + 16 * size_mb), 1024 if is32bit else 4096)
+    initial_heap = min(max_heap, 64 + 8 * size_mb)
+    args = ['-Xshare:auto', '-XX:-UsePerfData', '-Xms{}m'.format(initial_heap), '-Xmx{}m'.format(max_heap)]
+
+    # C2 only pays off for long runs
+    if size_mb <= C1_ONLY_MAX_SIZE:
+        args.append('-XX:TieredStopAtLevel=1')
+
+    # the serial collector starts fastest, the parallel collector scales to large heaps
+    args.append('-XX:+UseSerialGC' if max_heap <= 1024 else '-XX:+UseParallelGC')
+    return args
+
+# the options of tuning_args(), probed with representative values; the options of a group
+# are probed with one JVM launch, Java rejects more than one garbage collector per launch
+PROBED_ARGS = [
+    ['-Xshare:auto', '-XX:-UsePerfData', '-Xms64m', '-Xmx512m', '-XX:TieredStopAtLevel=1', '-XX:+UseSerialGC'],
+    ['-XX:+UseParallelGC'],
+]
+
+# get the name of an option without its value, e.g. -Xmx for -Xmx512m
+def option_name(arg):
+    return re.split(r'=|(?<=^-Xm[sx])\d', arg, 1)[0]
+
+# get the Java options that the Java binary accepts; the options of a group are only probed one by one if the group fails
+def supported_args(java_path, groups):
+    def accepted(args):
+        try:
+            ret, returncode = jarWrapper(*([java_path] + args + ['-version']))
+        except OSError:
+            return False
+        return returncode == 0
+
+    supported = []
+    for args in groups:
+        if accepted(args):
+            supported.extend(args)
+        else:
+            supported.extend(arg for arg in args if accepted([arg]))
+    return supported
+
+# get the cached names of the supported options; the Java binary is only probed again if it changed
+def get_supported_options(prefs, env, java_path):
+    env = dict(prefs.get('environment', env))
+    cached = env.get('fast_start_options')
+    if cached is None or cached[:2] != [java_path, env.get('java_stamp')]:
+        options = [option_name(arg) for arg in supported_args(java_path, PROBED_ARGS)]
+        cached = [java_path, env.get('java_stamp'), options]
+        env['fast_start_options'] = cached
+        prefs['environment'] = env
+        if hasattr(prefs, 'commit'):
+            prefs.commit()
+    return cached[2]
+
+# heap, JIT and GC options for a short EPUBCheck run that the Java binary supports
+def get_tuning_args(prefs, env, java_path, size=0):
+    supported = get_supported_options(prefs, env, java_path)
+    return [arg for arg in tuning_args(env['java_version'], size, env['is32bit']) if option_name(arg) in supported]
+
+# the information an archive depends on: Java, epubcheck.jar and the libraries
+def archive_stamp(java_version, epc_path):
+    epc_lib_dir = os.path.join(os.path.dirname(epc_path), 'lib')
+    libs = []
+    if os.path.isdir(epc_lib_dir):
+        libs = [[file_name, file_stamp(os.path.join(epc_lib_dir, file_name))] for file_name in sorted(os.listdir(epc_lib_dir))]
+    return [java_version, epc_path, file_stamp(epc_path), libs]
+
+def archive_path(epc_path):
+    return os.path.join(os.path.dirname(epc_path), ARCHIVE_NAME)
+
+# check if the archive was created for the current Java and EPUBCheck files
+def archive_is_current(java_version, epc_path):
+    try:
+        with open(archive_path(epc_path) + '.json', 'rb') as f:
+            stamp = json.loads(f.read().decode('utf-8'))
+    except (OSError, ValueError):
+        return False
+    return stamp == archive_stamp(java_version, epc_path) and os.path.isfile(archive_path(epc_path))
+
+# write a small, valid EPUB 3 book for the archive training run
+def write_sample_epub(epub_path):
+    container_xml = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+        '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>')
+    content_opf = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="uid">urn:uuid:8d1b6c4e-5f0a-4b7e-9a51-1c2a3e4f5a6b</dc:identifier>'
+        '<dc:title>EPUBCheck</dc:title><dc:language>en</dc:language><meta property="dcterms:modified">2023-01-01T00:00:00Z</meta></metadata>'
+        '<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+        '<item id="text" href="text.xhtml" media-type="application/xhtml+xml"/>'
+        '<item id="css" href="style.css" media-type="text/css"/></manifest>'
+        '<spine><itemref idref="text"/></spine></package>')
+    nav_xhtml = ('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"><head><title>Contents</title></head>'
+        '<body><nav epub:type="toc"><ol><li><a href="text.xhtml">Text</a></li></ol></nav></body></html>')
+    text_xhtml = ('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Text</title><link rel="stylesheet" href="style.css"/></head>'
+        '<body><h1 id="t">Text</h1><p>Text <a href="#t">link</a></p></body></html>')
+    with zipfile.ZipFile(epub_path, 'w') as archive:
+        archive.writestr('mimetype', 'application/epub+zip', zipfile.ZIP_STORED)
+        archive.writestr('META-INF/container.xml', container_xml, zipfile.ZIP_DEFLATED)
+        archive.writestr('OEBPS/content.opf', content_opf, zipfile.ZIP_DEFLATED)
+        archive.writestr('OEBPS/nav.xhtml', nav_xhtml, zipfile.ZIP_DEFLATED)
+        archive.writestr('OEBPS/text.xhtml', text_xhtml, zipfile.ZIP_DEFLATED)
+        archive.writestr('OEBPS/style.css', 'p { margin: 0 }', zipfile.ZIP_DEFLATED)
+
+# create a dynamic AppCDS archive (Java 13+) of the classes loaded while checking a sample book
+def create_archive(jvm_args, java_version, epc_path):
+    if java_major_version(java_version) < 13:
+        return False
+    path = archive_path(epc_path)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        epub_path = os.path.join(temp_dir, 'sample.epub')
+        write_sample_epub(epub_path)
+        temp_archive = os.path.join(temp_dir, ARCHIVE_NAME)
+        args = jvm_args + ['-XX:ArchiveClassesAtExit=' + temp_archive, '-jar', epc_path, epub_path]
+        try:
+            ret, returncode = jarWrapper(*args)
+        except OSError:
+            return False
+        if not os.path.isfile(temp_archive):
+            print('AppCDS archive not created:', ret[1].decode('utf-8', 'replace'))
+            return False
+        try:
+            shutil.move(temp_archive, path)
+            with open(path + '.json', 'wb') as f:
+                f.write(json.dumps(archive_stamp(java_version, epc_path)).encode('utf-8'))
+        except OSError as e:
+            # e.g. the archive is in use by a running check on Windows
+            print('AppCDS archive not replaced:', e)
+            return False
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return True
+
+# get the JVM arguments of a fast start run; the archive is only used if it's current
+def fast_start_args(jvm_args, tuning, java_version, epc_path):
+    args = list(jvm_args) + tuning
+    if java_major_version(java_version) >= 13 and archive_is_current(java_version, epc_path):
+        # don't print warnings if the archive can't be mapped
+        args.extend(['-XX:SharedArchiveFile=' + archive_path(epc_path), '-Xlog:cds=off,cds+dynamic=off'])
+    return args
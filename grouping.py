@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# groups of EPUBCheck messages for the dock, by message id, file or severity
+
+# standard libraries
+import os, re
+
+# sort order of the message types
+SEVERITY_ORDER = {'FATAL': 0, 'ERROR': 1, 'WARNING': 2, 'INFO': 3, 'USAGE': 4}
+
+# quoted values and numbers in message texts, e.g. the property in 'CSS property "foo" is not allowed'
+VALUE_PATTERN = re.compile(r'"[^"]*"|\'[^\']*\'|\b\d+(?:\.\d+)?\b')
+
+# get the text of a message without its values
+def message_template(msg):
+    return VALUE_PATTERN.sub(lambda match: match.group(0)[0] + '…' + match.group(0)[0] if match.group(0)[0] in '"\'' else '#', msg)
+
+# group keys of the grouping modes
+def problem_key(message):
+    return (message.err_code, message_template(message.msg))
+
+def file_key(message):
+    return message.filepath
+
+GROUP_KEYS = {
+    'problem': problem_key,
+    'file': file_key,
+}
+
+class MessageGroup(object):
+    '''
+    The messages of one problem or file: the number of messages per file and the first
+    max_locations messages. count includes collapsed duplicates, size doesn't.
+    '''
+
+    __slots__ = ('key', 'mode', 'first', 'severity', 'count', 'size', 'files', 'locations')
+
+    def __init__(self, key, mode, first):
+        self.key = key
+        self.mode = mode
+        self.first = first
+        self.severity = first.severity
+        self.count = 0
+        self.size = 0
+        self.files = {}
+        self.locations = []
+
+    def add(self, message, max_locations):
+        self.count += message.count
+        self.size += 1
+        self.files[message.filepath] = self.files.get(message.filepath, 0) + message.count
+        if SEVERITY_ORDER.get(message.severity, 5) < SEVERITY_ORDER.get(self.severity, 5):
+            self.severity = message.severity
+        if len(self.locations) < max_locations:
+            self.locations.append(message)
+
+    @property
+    def title(self):
+        if self.mode == 'file':
+            title = '{}: {:,} messages'.format(os.path.basename(self.first.filepath), self.count)
+        elif len(self.files) == 1:
+            title = '{}: {} (×{:,} in {})'.format(self.first.err_code, message_template(self.first.msg), self.count, os.path.basename(self.first.filepath))
+        else:
+            title = '{}: {} (×{:,} in {:,} files)'.format(self.first.err_code, message_template(self.first.msg), self.count, len(self.files))
+        if self.size > len(self.locations):
+            title += ', first {:,} shown'.format(len(self.locations))
+        return title
+
+    def file_summary(self, max_files=20):
+        ''' The files with the most messages, e.g. for a tooltip '''
+        files = sorted(self.files.items(), key=lambda item: -item[1])
+        lines = ['{}: {:,}'.format(filepath, count) for filepath, count in files[:max_files]]
+        if len(files) > max_files:
+            lines.append('{:,} more files'.format(len(files) - max_files))
+        return '\n'.join(lines)
+
+class MessageGroups(object):
+    '''
+    Buckets messages by problem (message ID and text without values) or by file.
+    Only the first max_locations messages of a group are kept, so the number of
+    groups and rows grows with the number of distinct problems.
+    '''
+
+    def __init__(self, mode='problem', max_locations=50):
+        self.mode = mode
+        self.group_key = GROUP_KEYS[mode]
+        self.max_locations = max_locations
+        self.groups = []
+        self.index = {}
+
+    def add(self, messages):
+        for message in messages:
+            key = self.group_key(message)
+            group = self.index.get(key)
+            if group is None:
+                group = self.index[key] = MessageGroup(key, self.mode, message)
+                self.groups.append(group)
+            group.add(message, self.max_locations)
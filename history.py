@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# on-disk history of the check results of each book
+
+# standard libraries
+import time, sqlite3
+from collections import Counter
+
+try:
+    from calibre_plugins.epub_check.message_parser import Message
+except ImportError:
+    from message_parser import Message
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    book_key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL,
+    run_time REAL NOT NULL,
+    epc_version TEXT NOT NULL,
+    returncode INTEGER,
+    message_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_book_time ON runs (book_id, run_time);
+CREATE INDEX IF NOT EXISTS runs_version ON runs (epc_version);
+CREATE TABLE IF NOT EXISTS message_keys (
+    id INTEGER PRIMARY KEY,
+    severity TEXT NOT NULL,
+    msg_id TEXT NOT NULL,
+    filepath TEXT NOT NULL,
+    msg TEXT NOT NULL,
+    UNIQUE (severity, msg_id, filepath, msg)
+);
+CREATE INDEX IF NOT EXISTS message_keys_id ON message_keys (msg_id);
+CREATE TABLE IF NOT EXISTS run_messages (
+    run_id INTEGER NOT NULL,
+    key_id INTEGER NOT NULL,
+    line INTEGER,
+    col INTEGER,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS run_messages_run ON run_messages (run_id);
+CREATE INDEX IF NOT EXISTS run_messages_key ON run_messages (key_id);
+'''
+
+# the runs of the first version stored the text of each message; they're moved to the tables above
+MIGRATE_MESSAGES = '''
+INSERT OR IGNORE INTO message_keys (severity, msg_id, filepath, msg) SELECT severity, msg_id, filepath, msg FROM messages;
+INSERT INTO run_messages (run_id, key_id, line, col, count)
+    SELECT m.run_id, k.id, m.line, m.col, m.count FROM messages m
+    JOIN message_keys k ON k.severity = m.severity AND k.msg_id = m.msg_id AND k.filepath = m.filepath AND k.msg = m.msg
+    ORDER BY m.rowid;
+DROP TABLE messages;
+'''
+
+# get the unique identifier of the package document of a calibre container; None if it has none
+def book_identifier(container):
+    unique_ids = container.opf_xpath('//opf:package/@unique-identifier')
+    if not unique_ids:
+        return None
+    for element in container.opf_xpath('//dc:identifier'):
+        if element.get('id') == unique_ids[0] and element.text and element.text.strip():
+            return element.text.strip()
+    return None
+
+class History(object):
+    '''
+    SQLite store of the messages of the last max_runs checks of each book. Books are
+    identified by their unique identifier or, if they have none, by their path; older
+    runs are deleted when a new run is added.
+
+    The message texts and file paths are stored once in message_keys, runs only store
+    the key, line, column and count of their messages.
+    '''
+
+    def __init__(self, db_path, max_runs=50):
+        self.db_path = db_path
+        self.max_runs = max_runs
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.db_path)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+            if self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages'").fetchone():
+                with self.connection:
+                    self.connection.executescript(MIGRATE_MESSAGES)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def book_id(self, book_key, create=False):
+        connection = self.connect()
+        row = connection.execute('SELECT id FROM books WHERE book_key = ?', (book_key,)).fetchone()
+        if row is not None:
+            return row[0]
+        if not create:
+            return None
+        return connection.execute('INSERT INTO books (book_key) VALUES (?)', (book_key,)).lastrowid
+
+    def rename_book(self, old_key, new_key):
+        ''' Moves the runs of a book to a new key, unless the new key already has runs '''
+        connection = self.connect()
+        with connection:
+            if self.book_id(new_key) is None:
+                connection.execute('UPDATE books SET book_key = ? WHERE book_key = ?', (new_key, old_key))
+
+    def last_run(self, book_key):
+        ''' Returns the (run_id, run_time, epc_version) of the last run of a book or None '''
+        book_id = self.book_id(book_key)
+        if book_id is None:
+            return None
+        return self.connect().execute('SELECT id, run_time, epc_version FROM runs WHERE book_id = ? ORDER BY run_time DESC LIMIT 1',
+                                      (book_id,)).fetchone()
+
+    def messages(self, run_id):
+        messages = []
+        for severity, msg_id, filepath, line, col, msg, count in self.connect().execute(
+                'SELECT k.severity, k.msg_id, k.filepath, m.line, m.col, k.msg, m.count FROM run_messages m '
+                'JOIN message_keys k ON k.id = m.key_id WHERE m.run_id = ? ORDER BY m.rowid', (run_id,)):
+            messages.append(Message(filepath, None if line is None else str(line), None if col is None else str(col),
+                                    '{}({})'.format(severity, msg_id), msg, count))
+        return messages
+
+    def add_run(self, book_key, epc_version, messages, returncode=None, run_time=None):
+        ''' Stores the messages of a run and deletes the oldest runs of the book; returns the run ID '''
+        connection = self.connect()
+        with connection:
+            book_id = self.book_id(book_key, create=True)
+            run_id = connection.execute('INSERT INTO runs (book_id, run_time, epc_version, returncode, message_count) VALUES (?, ?, ?, ?, ?)',
+                                        (book_id, run_time or time.time(), epc_version or '', returncode, len(messages))).lastrowid
+            key_ids = {}
+            rows = []
+            for message in messages:
+                key = tuple(message.err_code.rstrip(')').partition('(')[::2]) + (message.filepath, message.msg)
+                key_id = key_ids.get(key)
+                if key_id is None:
+                    key_id = key_ids[key] = self.key_id(key)
+                rows.append((run_id, key_id, int(message.line) if message.line else None,
+                             int(message.col) if message.col else None, message.count))
+            connection.executemany('INSERT INTO run_messages (run_id, key_id, line, col, count) VALUES (?, ?, ?, ?, ?)', rows)
+
+            # keep the last max_runs runs of the book
+            old_runs = [row[0] for row in connection.execute('SELECT id FROM runs WHERE book_id = ? ORDER BY run_time DESC LIMIT -1 OFFSET ?',
+                                                             (book_id, self.max_runs))]
+            if old_runs:
+                connection.executemany('DELETE FROM run_messages WHERE run_id = ?', [(old_run,) for old_run in old_runs])
+                connection.executemany('DELETE FROM runs WHERE id = ?', [(old_run,) for old_run in old_runs])
+                connection.execute('DELETE FROM message_keys WHERE NOT EXISTS (SELECT 1 FROM run_messages WHERE key_id = message_keys.id)')
+        return run_id
+
+    def key_id(self, key):
+        # the ID of a (severity, msg_id, filepath, msg) message key; new keys are added
+        connection = self.connect()
+        row = connection.execute('SELECT id FROM message_keys WHERE severity = ? AND msg_id = ? AND filepath = ? AND msg = ?', key).fetchone()
+        if row is not None:
+            return row[0]
+        return connection.execute('INSERT INTO message_keys (severity, msg_id, filepath, msg) VALUES (?, ?, ?, ?)', key).lastrowid
+
+# messages are compared without their line and column numbers, which change when a file is edited
+def message_key(message):
+    return (message.err_code, message.filepath, message.msg)
+
+def diff_messages(previous_messages, messages):
+    '''
+    Compares the messages of two runs. Returns a {message: 'new' or 'unchanged'} map of
+    the current messages and the list of fixed previous messages.
+    '''
+    remaining = Counter()
+    for message in previous_messages:
+        remaining[message_key(message)] += 1
+    statuses = {}
+    for message in messages:
+        key = message_key(message)
+        if remaining[key] > 0:
+            remaining[key] -= 1
+            statuses[message] = 'unchanged'
+        else:
+            statuses[message] = 'new'
+
+    # the last previous messages of a key are the ones that were fixed
+    fixed = []
+    for message in reversed(previous_messages):
+        key = message_key(message)
+        if remaining[key] > 0:
+            remaining[key] -= 1
+            fixed.append(message)
+    fixed.reverse()
+    return statuses, fixed
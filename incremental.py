@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# standard libraries
+import os
+
+# content documents that EPUBCheck can validate on their own (--mode)
+SINGLE_FILE_MODES = {
+    'application/xhtml+xml': 'xhtml',
+    'image/svg+xml': 'svg',
+}
+
+# messages about references to other files and package properties; single file checks can't report them
+CROSS_FILE_IDS = {
+    'RSC-006', 'RSC-007', 'RSC-007w', 'RSC-008', 'RSC-009', 'RSC-010', 'RSC-011', 'RSC-012', 'RSC-013',
+    'RSC-014', 'RSC-015', 'RSC-026', 'RSC-032', 'OPF-014', 'OPF-015', 'OPF-018', 'OPF-018b',
+}
+
+class CheckState(object):
+    '''
+    The result of the last EPUBCheck run of a book, used to decide how much of the
+    book has to be checked again.
+    '''
+
+    def __init__(self, book_key, options_key, fingerprints, messages, stdout='', returncode=0, partial=False):
+        # partial: only changed files were checked, the cross-file messages may be out of date
+        self.partial = partial
+        self.book_key = book_key
+        self.options_key = options_key
+        self.fingerprints = fingerprints
+        self.messages = messages
+        self.stdout = stdout
+        self.returncode = returncode
+
+def fingerprint_container(container):
+    ''' Returns a {name: (size, mtime)} map of all files in the container's mime_map '''
+    # write modified files to disk, so that their size and time stamp are current
+    for name in tuple(container.dirtied):
+        container.commit_item(name, keep_parsed=True)
+
+    fingerprints = {}
+    for name in container.mime_map:
+        try:
+            st = os.stat(container.name_to_abspath(name))
+            fingerprints[name] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            fingerprints[name] = None
+    return fingerprints
+
+def plan_check(previous, book_key, options_key, fingerprints, container):
+    '''
+    Compares the current container with the last run of the same book and returns one of:
+
+    ('cached', [])             nothing changed, the previous messages can be reused
+    ('files', [(name, mode)])  only content documents changed, they can be checked on their own
+    ('full', [])               everything has to be checked
+    '''
+    if previous is None or previous.book_key != book_key or previous.options_key != options_key:
+        return 'full', []
+
+    # added or deleted files affect the manifest
+    if set(fingerprints) != set(previous.fingerprints):
+        return 'full', []
+
+    changed = [name for name in fingerprints if fingerprints[name] != previous.fingerprints[name]]
+    if changed == []:
+        return 'cached', []
+
+    # package documents, navigation documents and styles are cross-file resources
+    nav_names = set()
+    try:
+        from calibre.ebooks.oeb.polish.toc import find_existing_nav_toc, find_existing_ncx_toc
+        nav_names.update([find_existing_nav_toc(container), find_existing_ncx_toc(container)])
+    except ImportError:
+        pass
+    files = []
+    for name in changed:
+        mode = SINGLE_FILE_MODES.get(container.mime_map.get(name))
+        if mode is None or name == container.opf_name or name in nav_names:
+            return 'full', []
+        files.append((name, mode))
+    return 'files', files
+
+def plan_parallel_check(container):
+    '''
+    Returns the [(name, mode)] runs that check a book file by file: the package document,
+    the navigation document and the content documents, largest first. Cross-document
+    checks (links, fragment identifiers, CSS) are only done by a full check.
+    '''
+    nav_name = None
+    try:
+        from calibre.ebooks.oeb.polish.toc import find_existing_nav_toc
+        nav_name = find_existing_nav_toc(container)
+    except ImportError:
+        pass
+    files = []
+    for name, mime in container.mime_map.items():
+        mode = SINGLE_FILE_MODES.get(mime)
+        if mode is None or name == container.opf_name:
+            continue
+        try:
+            size = os.path.getsize(container.name_to_abspath(name))
+        except OSError:
+            size = 0
+        files.append((size, name, 'nav' if name == nav_name else mode))
+    files.sort(key=lambda f: -f[0])
+    return [(container.opf_name, 'opf')] + [(name, mode) for size, name, mode in files]
+
+# check if a message can only be reported by a check of the whole book
+def is_cross_file(message):
+    return message.err_code.partition('(')[2].rstrip(')') in CROSS_FILE_IDS
+
+def merge_messages(previous_messages, checked_names, new_messages):
+    '''
+    Replaces the previous messages of the checked files with the new messages. The
+    cross-file messages of the checked files are kept until the next full check.
+    '''
+    checked_names = set(checked_names)
+    kept = [msg for msg in previous_messages if msg.filepath not in checked_names or is_cross_file(msg)]
+    return kept + list(new_messages)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+'''
+EPUBCheck message parser for the text output and the JSON report.
+
+Text messages are parsed in a single pass with one precompiled pattern:
+
+    ERROR(RSC-005): /tmp/temp.epub/OEBPS/Text/ch1.xhtml(12,5): Error while parsing file: ...
+    WARNING(OPF-085): /tmp/temp.epub/OEBPS/content.opf: "dc:identifier" value ...
+
+The severity and the message ID aren't localized, the message text is.
+'''
+
+# standard libraries
+import io, os, re, json
+
+# EPUBCheck message types
+MESSAGE_TYPES = ('ERROR', 'WARNING', 'FATAL', 'INFO', 'USAGE')
+
+# severity(ID): path[(line,column)]: message; the path ends at the first ": " or position,
+# so Windows drive letters (C:\...) and colons in the message text don't need special handling
+MESSAGE_PATTERN = re.compile(r'''
+    (?P<err_code>(?:ERROR|WARNING|FATAL|INFO|USAGE)\([^)]*\))
+    :\s(?P<path>.*?)
+    (?:\((?P<line>-?\d+),(?P<col>-?\d+)?\))?
+    :\s(?P<msg>.*)
+''', re.VERBOSE | re.DOTALL)
+
+# path of a file inside a checked epub, e.g. /tmp/temp.epub/OEBPS/Text/ch1.xhtml
+EPUB_PATH_PATTERN = re.compile(r'\.epub[/\\](.+)$', re.IGNORECASE)
+
+class Message(object):
+    '''
+    A single EPUBCheck message. count is the number of identical messages that were collapsed into this one.
+    '''
+
+    __slots__ = ('filepath', 'line', 'col', 'err_code', 'msg', 'count')
+
+    def __init__(self, filepath, line, col, err_code, msg, count=1):
+        self.filepath = filepath
+        self.line = line
+        self.col = col
+        self.err_code = err_code
+        self.msg = msg
+        self.count = count
+
+    @property
+    def severity(self):
+        return self.err_code.partition('(')[0]
+
+    @property
+    def message(self):
+        message = format_message(self.filepath, self.line, self.col, self.err_code, self.msg)
+        if self.count > 1:
+            message = '{} (\u00d7{:,} in {})'.format(message, self.count, os.path.basename(self.filepath))
+        return message
+
+    def to_list(self):
+        return [self.filepath, self.line, self.col, self.err_code, self.msg, self.count]
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(*data)
+
+class MessageFilter(object):
+    '''
+    The message types and message ID prefixes (e.g. 'ACC-') that are kept. Lines and
+    JSON messages are filtered before their message records are built.
+    '''
+
+    def __init__(self, severities=MESSAGE_TYPES, ids=None):
+        self.severities = tuple(severities)
+        self.ids = tuple(ids) if ids else None
+
+    def accepts(self, text):
+        ''' Checks a message line or an error code, e.g. 'USAGE(ACC-011)' '''
+        if not text.startswith(self.severities):
+            return False
+        return self.ids is None or text[text.find('(') + 1:].startswith(self.ids)
+
+    def key(self):
+        ''' Identifies the filter, e.g. in cache keys '''
+        return ['filter:{}:{}'.format(','.join(self.severities), ','.join(self.ids or ()))]
+
+# map the file names and the book relative paths of the files of a book to their book relative paths;
+# the paths are kept for files with the same name in different folders
+def make_name_to_href(hrefs):
+    name_to_href = {}
+    for href in hrefs:
+        name_to_href[href.rpartition('/')[2]] = href
+    for href in hrefs:
+        name_to_href[href] = href
+    return name_to_href
+
+# get the book relative path of a file reported by EPUBCheck; 'NA' if it's not part of the book
+def resolve_path(path, epub_name_to_href, hrefs=None):
+    if hrefs is None:
+        hrefs = set(epub_name_to_href.values())
+    if path in hrefs:
+        return path
+
+    # the path inside the epub identifies files with the same name in different folders
+    match = EPUB_PATH_PATTERN.search(path)
+    if match is not None:
+        href = match.group(1).replace('\\', '/')
+        if href in hrefs:
+            return href
+
+    # fall back to the file name
+    name = path.replace('\\', '/').rpartition('/')[2]
+    return epub_name_to_href.get(name, 'NA')
+
+# parse a single EPUBCheck message line; returns None for other lines
+# paths is an optional cache of resolved paths, most messages refer to a few files
+def parse_line(line, epub_name_to_href, hrefs=None, paths=None):
+    if not line.startswith(MESSAGE_TYPES):
+        return None
+    match = MESSAGE_PATTERN.match(line)
+    if match is None:
+        return None
+    err_code, path, linenumber, colnumber, msg = match.group('err_code', 'path', 'line', 'col', 'msg')
+
+    # -1 means unknown
+    if linenumber is not None and linenumber.startswith('-'):
+        linenumber = None
+    if colnumber is not None and colnumber.startswith('-'):
+        colnumber = None
+
+    if paths is None:
+        filepath = resolve_path(path, epub_name_to_href, hrefs)
+    else:
+        filepath = paths.get(path)
+        if filepath is None:
+            filepath = paths[path] = resolve_path(path, epub_name_to_href, hrefs)
+    return Message(filepath, linenumber, colnumber, err_code, msg.strip())
+
+# parse EPUBCheck output lines, e.g. a pipe or a list of lines; other lines are skipped
+def parse_lines(lines, epub_name_to_href, message_filter=None):
+    hrefs = set(epub_name_to_href.values())
+    paths = {}
+    for line in lines:
+        if message_filter is not None and not message_filter.accepts(line):
+            continue
+        message = parse_line(line.rstrip('\r\n'), epub_name_to_href, hrefs, paths)
+        if message is not None:
+            yield message
+
+# reports up to this size are loaded at once, larger reports are read one location at a time
+MAX_LOADED_REPORT_SIZE = 4 * 1024 * 1024
+
+# whitespace between JSON tokens
+JSON_WHITESPACE = re.compile(r'[ \t\r\n]*')
+
+class JsonReader(object):
+    '''
+    Reads a JSON document from a text file one value at a time: objects and arrays are
+    walked with items() and elements(), which yield before each value; the caller reads
+    the value with value() or skip().
+    '''
+
+    def __init__(self, f, chunk_size=1024 * 1024):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Unexpected {!r} in JSON report, expected {!r}'.format(char, chars))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # the value may continue in the next chunk
+                if not self.fill():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def elements(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.expect(',]') == ']':
+                return
+
+    def skip(self):
+        char = self.peek()
+        if char == '{':
+            for key in self.items():
+                self.skip()
+        elif char == '[':
+            for index in self.elements():
+                self.skip()
+        else:
+            self.value()
+
+class StreamedReport(object):
+    '''
+    A large EPUBCheck JSON report. The message texts are read when the report is opened,
+    the locations are read from the file while the messages are parsed. EPUBCheck writes
+    the suggestion of a message after its locations, so the file is read twice.
+    '''
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.headers = self.read_headers()
+
+    def walk_messages(self):
+        # yields the reader at each message of the messages array
+        with io.open(self.json_path, 'r', encoding='utf-8') as f:
+            reader = JsonReader(f)
+            found = False
+            for key in reader.items():
+                if key != 'messages':
+                    reader.skip()
+                    continue
+                found = True
+                for index in reader.elements():
+                    yield reader
+        if not found:
+            raise ValueError('No messages in JSON report')
+
+    def read_headers(self):
+        headers = []
+        for reader in self.walk_messages():
+            header = {}
+            for key in reader.items():
+                if key == 'locations':
+                    for index in reader.elements():
+                        reader.value()
+                else:
+                    header[key] = reader.value()
+            headers.append(header)
+        return headers
+
+    def read_locations(self, reader):
+        found = False
+        for index in reader.elements():
+            found = True
+            yield reader.value()
+        # messages without locations are reported once
+        if not found:
+            yield {}
+
+    def messages(self):
+        for index, reader in enumerate(self.walk_messages()):
+            locations = None
+            for key in reader.items():
+                if key != 'locations':
+                    reader.skip()
+                    continue
+                locations = self.read_locations(reader)
+                yield dict(self.headers[index], locations=locations)
+                # the caller may not have read all locations
+                for location in locations:
+                    pass
+            if locations is None:
+                yield dict(self.headers[index])
+
+    def get(self, key, default=None):
+        return self.messages() if key == 'messages' else default
+
+# read an EPUBCheck JSON report (--json); returns None if EPUBCheck didn't write a valid report.
+# Large reports are streamed, e.g. a book with 200,000 locations of the same message.
+def read_json_report(json_path):
+    try:
+        if os.path.getsize(json_path) > MAX_LOADED_REPORT_SIZE:
+            return StreamedReport(json_path)
+        with open(json_path, 'rb') as f:
+            report = json.loads(f.read().decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(report, dict) or 'messages' not in report:
+        return None
+    return report
+
+# parse an EPUBCheck JSON report
+def parse_json_report(report, epub_name_to_href, message_filter=None):
+    hrefs = set(epub_name_to_href.values())
+
+    for epc_message in report.get('messages', []):
+        severity = epc_message.get('severity', 'ERROR')
+        if severity == 'SUPPRESSED':
+            continue
+        err_code = '{}({})'.format(severity, epc_message.get('ID', ''))
+        if message_filter is not None and not message_filter.accepts(err_code):
+            continue
+        msg = epc_message.get('message', '').strip()
+        if epc_message.get('suggestion'):
+            msg = '{} {}'.format(msg, epc_message['suggestion'].strip())
+
+        # EPUBCheck reports one message per location; paths are relative to the container root
+        for location in epc_message.get('locations') or [{}]:
+            filepath = resolve_path(location.get('path') or '', epub_name_to_href, hrefs)
+
+            # get line/column numbers
+            linenumber = colnumber = None
+            if location.get('line', -1) > 0:
+                linenumber = str(location['line'])
+            if location.get('column', -1) > 0:
+                colnumber = str(location['column'])
+
+            yield Message(filepath, linenumber, colnumber, err_code, msg)
+
+# assemble the error message displayed in the dock
+def format_message(filepath, linenumber, colnumber, err_code, msg):
+    return '{}{}{}{}: {}'.format(
+        os.path.basename(filepath),
+        ' Line: ' + linenumber if linenumber else ' ',
+        ' Col: ' + colnumber + ' ' if colnumber else '',
+        err_code, msg)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+'''
+Fast structural checks of a calibre container that run in-process before EPUBCheck:
+manifest and spine references, well-formed XML and duplicate IDs. The mimetype file
+isn't checked, calibre removes it when it opens a book and writes it when it saves one.
+
+The messages use the EPUBCheck message format with PRE-nnn IDs, e.g.
+
+    FATAL(PRE-006): OEBPS/Text/ch1.xhtml Line: 12 Col: 5: Opening and ending tag mismatch: p line 10 and body
+'''
+
+# standard libraries
+import os
+
+# lxml is part of calibre
+from lxml import etree
+
+try:
+    from calibre_plugins.epub_check.message_parser import Message
+    from calibre_plugins.epub_check.timing import timed
+except ImportError:
+    from message_parser import Message
+    from timing import timed
+
+# ID prefix of pre-flight messages
+PREFLIGHT_ID = 'PRE'
+
+# files that have to be well-formed XML
+XML_MIME_TYPES = {
+    'application/xhtml+xml', 'image/svg+xml', 'application/oebps-package+xml', 'application/x-dtbncx+xml',
+    'application/smil+xml', 'application/xml', 'text/xml',
+}
+
+# files with IDs that links can refer to
+ID_MIME_TYPES = {'application/xhtml+xml', 'image/svg+xml'}
+
+def preflight_message(severity, number, filepath, msg, line=None, col=None):
+    err_code = '{}({}-{:03d})'.format(severity, PREFLIGHT_ID, number)
+    return Message(filepath, str(line) if line else None, str(col) if col else None, err_code, msg)
+
+# pre-flight checks that EPUBCheck does, too: malformed XML (RSC-016) and duplicate IDs (RSC-005)
+EPUBCHECK_IDS = {'PRE-006': 'RSC-016', 'PRE-007': 'RSC-005'}
+
+# check if EPUBCheck reports the problem of a pre-flight message, too; the message is removed when
+# the EPUBCheck results of the file arrive
+def reported_by_epubcheck(message):
+    return message.err_code.partition('(')[2].rstrip(')') in EPUBCHECK_IDS
+
+# check if the pre-flight checks found fatal errors, e.g. malformed XML; the book can't pass EPUBCheck then,
+# although EPUBCheck goes on and reports the other problems of the book
+def has_fatal(messages):
+    return any(message.severity == 'FATAL' for message in messages)
+
+def check_package(container):
+    messages = []
+    opf_name = container.opf_name
+
+    # manifest items: unique IDs and existing files
+    manifest_ids = set()
+    for item in container.opf_xpath('//opf:manifest/opf:item'):
+        item_id = item.get('id')
+        if item_id in manifest_ids:
+            messages.append(preflight_message('ERROR', 3, opf_name, 'Duplicate manifest item ID "{}".'.format(item_id), item.sourceline))
+        manifest_ids.add(item_id)
+
+        # remote resources and empty hrefs have no name
+        href = item.get('href') or ''
+        name = container.href_to_name(href, opf_name) if href else None
+        if name is not None and not container.exists(name):
+            messages.append(preflight_message('ERROR', 2, opf_name, 'The manifest refers to the missing file "{}".'.format(href), item.sourceline))
+
+    # spine items have to refer to manifest items
+    itemrefs = container.opf_xpath('//opf:spine/opf:itemref')
+    for itemref in itemrefs:
+        idref = itemref.get('idref')
+        if idref not in manifest_ids:
+            messages.append(preflight_message('ERROR', 4, opf_name, 'The spine item "{}" isn\'t declared in the manifest.'.format(idref), itemref.sourceline))
+    if not itemrefs:
+        messages.append(preflight_message('ERROR', 5, opf_name, 'The spine doesn\'t contain any items.'))
+    return messages
+
+def check_xml(path, name, check_ids):
+    # the container's own trees come from a lenient parser that repairs errors, so the file is parsed again
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (OSError, IOError):
+        return []
+    parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True, huge_tree=True)
+    try:
+        root = etree.fromstring(data, parser)
+    except etree.XMLSyntaxError:
+        root = None
+
+    # like EPUBCheck, only the first error is reported; warnings are e.g. entities of a DTD that isn't loaded
+    for error in parser.error_log:
+        if error.level >= etree.ErrorLevels.ERROR:
+            return [preflight_message('FATAL', 6, name, 'Malformed XML: {}'.format(error.message), error.line, error.column)]
+
+    messages = []
+    if check_ids and root is not None:
+        ids = set()
+        for element in root.iter(tag=etree.Element):
+            element_id = element.get('id')
+            if element_id is None:
+                continue
+            if element_id in ids:
+                messages.append(preflight_message('ERROR', 7, name, 'Duplicate ID "{}".'.format(element_id), element.sourceline))
+            ids.add(element_id)
+    return messages
+
+@timed('preflight')
+def run_preflight(container, fingerprints=None, cache=None):
+    '''
+    Returns the messages of the pre-flight checks; modified files have to be committed to disk first.
+    cache is a {name: (fingerprint, messages)} map of the XML checks of earlier runs, the files
+    are only parsed again if their fingerprint changed.
+    '''
+    messages = check_package(container)
+    for name, mime in sorted(container.mime_map.items()):
+        if mime in XML_MIME_TYPES or os.path.splitext(name)[1].lower() in ('.xml', '.opf', '.ncx'):
+            fingerprint = fingerprints.get(name) if fingerprints is not None else None
+            if cache is not None and fingerprint is not None and name in cache and cache[name][0] == fingerprint:
+                messages.extend(cache[name][1])
+                continue
+            file_messages = check_xml(container.name_to_abspath(name), name, mime in ID_MIME_TYPES)
+            if cache is not None and fingerprint is not None:
+                cache[name] = (fingerprint, file_messages)
+            messages.extend(file_messages)
+    return messages
+
+# the pre-flight checks of single content documents, e.g. the changed files of an incremental check
+@timed('preflight')
+def run_file_preflight(files):
+    ''' files: [(path, name)] '''
+    messages = []
+    for path, name in files:
+        messages.extend(check_xml(path, name, True))
+    return messages
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+'''
+Check profiles: the EPUBCheck reporting level and --profile, and the messages that are kept.
+Profiles are stored in the 'check_profiles' preference, e.g.
+
+    {"name": "Errors only", "level": "error", "epc_profile": null, "ids": null}
+
+level is one of fatal, error, warning, info and usage; null uses the usage preference.
+ids is a list of message ID prefixes, e.g. ["ACC-", "OPF-"]; null keeps all messages.
+'''
+
+try:
+    from calibre_plugins.epub_check.message_parser import MessageFilter, MESSAGE_TYPES
+except ImportError:
+    from message_parser import MessageFilter, MESSAGE_TYPES
+
+# EPUBCheck options of the reporting levels and the message types they report
+LEVELS = {
+    'fatal': ('--fatal', ('FATAL',)),
+    'error': ('--error', ('FATAL', 'ERROR')),
+    'warning': ('--warn', ('FATAL', 'ERROR', 'WARNING')),
+    'info': ('--info', ('FATAL', 'ERROR', 'WARNING', 'INFO')),
+    'usage': ('--usage', ('FATAL', 'ERROR', 'WARNING', 'INFO', 'USAGE')),
+}
+
+DEFAULT_PROFILES = [
+    {'name': 'Full', 'level': None, 'epc_profile': None, 'ids': None},
+    {'name': 'Errors only', 'level': 'error', 'epc_profile': None, 'ids': None},
+    {'name': 'Accessibility', 'level': 'usage', 'epc_profile': None, 'ids': ['ACC-']},
+    {'name': 'Dictionary', 'level': None, 'epc_profile': 'dict', 'ids': None},
+]
+
+def get_profiles(prefs):
+    return list(prefs.get('check_profiles', None) or DEFAULT_PROFILES)
+
+# get a profile by name; the selected profile if no name is given
+def get_profile(prefs, name=None):
+    profiles = get_profiles(prefs)
+    name = name or prefs.get('check_profile', None)
+    for profile in profiles:
+        if profile.get('name') == name:
+            return profile
+    return profiles[0]
+
+def profile_options(profile, usage=False):
+    '''
+    Returns the EPUBCheck options of a profile, whether usage messages are reported and the
+    message filter; the filter is None if all messages are kept.
+    '''
+    level = profile.get('level') or ('usage' if usage else None)
+    if level is not None and level not in LEVELS:
+        raise ValueError('Unknown reporting level of check profile {}: {}'.format(profile.get('name'), level))
+    epc_args = []
+    if level is not None:
+        epc_args.append(LEVELS[level][0])
+    if profile.get('epc_profile'):
+        epc_args.extend(['--profile', profile['epc_profile']])
+    severities = LEVELS[level][1] if level is not None else MESSAGE_TYPES
+    message_filter = None
+    if set(severities) != set(MESSAGE_TYPES) or profile.get('ids'):
+        message_filter = MessageFilter(severities, profile.get('ids'))
+    return epc_args, level == 'usage', message_filter
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# pytest plugin (see pytest.ini): the plugin folder is collected as a plain folder, not as a package,
+# so that pytest doesn't import the plugin's __init__, which needs calibre
+
+# standard libraries
+import os
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def pytest_collect_directory(path, parent):
+    if str(path) == PLUGIN_DIR:
+        return pytest.Dir.from_parent(parent, path=path)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# tests of the EPUBCheck message parser with text and JSON outputs in several locales
+# run with pytest from the plugin folder, or with python -m unittest discover -s tests
+
+# standard libraries
+import io, os, sys, json, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_parser import (
+    parse_line, parse_lines, read_json_report, parse_json_report, resolve_path, make_name_to_href, StreamedReport, MessageFilter
+)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# the files of the checked book; two files are called index.xhtml
+BOOK_HREFS = [
+    'mimetype', 'META-INF/container.xml', 'OEBPS/content.opf', 'OEBPS/Styles/style.css',
+    'OEBPS/Text/ch1.xhtml', 'OEBPS/Text/notes/index.xhtml', 'OEBPS/Text/index.xhtml',
+]
+EPUB_NAME_TO_HREF = make_name_to_href(BOOK_HREFS)
+
+def fixture_path(file_name):
+    return os.path.join(FIXTURE_DIR, file_name)
+
+def read_lines(file_name):
+    with io.open(fixture_path(file_name), 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def expected_messages(file_name):
+    with io.open(fixture_path(file_name.rpartition('.')[0] + '.expected.json'), 'r', encoding='utf-8') as f:
+        return [tuple(message) for message in json.load(f)]
+
+def message_tuples(messages):
+    return [(message.filepath, message.line, message.col, message.err_code, message.msg) for message in messages]
+
+class TextOutputTest(unittest.TestCase):
+
+    def check_fixture(self, file_name):
+        messages = message_tuples(parse_lines(read_lines(file_name), EPUB_NAME_TO_HREF))
+        self.assertEqual(messages, expected_messages(file_name))
+
+    def test_english_posix(self):
+        self.check_fixture('text_en_posix.txt')
+
+    def test_german_windows(self):
+        self.check_fixture('text_de_windows.txt')
+
+    def test_french_posix(self):
+        self.check_fixture('text_fr_posix.txt')
+
+    def test_japanese_windows(self):
+        self.check_fixture('text_ja_windows.txt')
+
+    def test_path_cache(self):
+        lines = read_lines('text_en_posix.txt')
+        paths = {}
+        cached = [parse_line(line, EPUB_NAME_TO_HREF, set(BOOK_HREFS), paths) for line in lines]
+        uncached = [parse_line(line, EPUB_NAME_TO_HREF) for line in lines]
+        self.assertEqual(message_tuples(m for m in cached if m), message_tuples(m for m in uncached if m))
+        self.assertIn('/tmp/epubcheck-run-k2j4/temp.epub/OEBPS/Text/ch1.xhtml', paths)
+
+    def test_other_lines(self):
+        for line in ('Validating using EPUB version 3.2 rules.', 'Messages: 0 fatals / 4 errors / 2 warnings / 0 infos',
+                     'ERRORS: not a message', 'WARNING(RSC-005) missing separator', ''):
+            self.assertIsNone(parse_line(line, EPUB_NAME_TO_HREF))
+
+    def test_message_filter(self):
+        message_filter = MessageFilter(('ERROR',), ['RSC-01'])
+        messages = message_tuples(parse_lines(read_lines('text_en_posix.txt'), EPUB_NAME_TO_HREF, message_filter))
+        self.assertEqual([message[3] for message in messages], ['ERROR(RSC-012)'])
+
+class JsonReportTest(unittest.TestCase):
+
+    def check_fixture(self, file_name):
+        report = read_json_report(fixture_path(file_name))
+        self.assertIsInstance(report, dict)
+        expected = expected_messages(file_name)
+        self.assertEqual(message_tuples(parse_json_report(report, EPUB_NAME_TO_HREF)), expected)
+
+        # large reports are streamed; the messages are the same
+        streamed = StreamedReport(fixture_path(file_name))
+        self.assertEqual(message_tuples(parse_json_report(streamed, EPUB_NAME_TO_HREF)), expected)
+
+    def test_english(self):
+        self.check_fixture('report_en.json')
+
+    def test_german(self):
+        self.check_fixture('report_de.json')
+
+    def test_streamed_filter(self):
+        # the locations of skipped messages are read past
+        streamed = StreamedReport(fixture_path('report_en.json'))
+        messages = message_tuples(parse_json_report(streamed, EPUB_NAME_TO_HREF, MessageFilter(('WARNING', 'USAGE'))))
+        self.assertEqual([message[3] for message in messages], ['WARNING(CSS-008)', 'USAGE(ACC-011)'])
+
+    def test_invalid_report(self):
+        self.assertIsNone(read_json_report(fixture_path('text_en_posix.txt')))
+        self.assertIsNone(read_json_report(fixture_path('missing.json')))
+
+class ResolvePathTest(unittest.TestCase):
+
+    def test_href(self):
+        self.assertEqual(resolve_path('OEBPS/Text/notes/index.xhtml', EPUB_NAME_TO_HREF), 'OEBPS/Text/notes/index.xhtml')
+
+    def test_path_inside_epub(self):
+        self.assertEqual(resolve_path('/tmp/x/temp.epub/OEBPS/Text/notes/index.xhtml', EPUB_NAME_TO_HREF), 'OEBPS/Text/notes/index.xhtml')
+        self.assertEqual(resolve_path('C:\\Temp\\x\\temp.epub\\OEBPS\\Text\\notes\\index.xhtml', EPUB_NAME_TO_HREF), 'OEBPS/Text/notes/index.xhtml')
+        self.assertEqual(resolve_path('C:\\Temp\\x\\Book.EPUB/OEBPS/Text/ch1.xhtml', EPUB_NAME_TO_HREF), 'OEBPS/Text/ch1.xhtml')
+
+    def test_file_name(self):
+        # e.g. a single file check of a copy of the file
+        self.assertEqual(resolve_path('/tmp/epubcheck-run-k2j4/0/ch1.xhtml', EPUB_NAME_TO_HREF), 'OEBPS/Text/ch1.xhtml')
+        self.assertEqual(resolve_path('C:\\Temp\\epubcheck-run-x7q1\\0\\style.css', EPUB_NAME_TO_HREF), 'OEBPS/Styles/style.css')
+
+    def test_not_in_book(self):
+        self.assertEqual(resolve_path('/tmp/epubcheck-run-k2j4/temp.epub', EPUB_NAME_TO_HREF), 'NA')
+        self.assertEqual(resolve_path('', EPUB_NAME_TO_HREF), 'NA')
+        self.assertEqual(resolve_path('/tmp/x/temp.epub/OEBPS/Text/ch9.xhtml', EPUB_NAME_TO_HREF), 'NA')
+
+if __name__ == '__main__':
+    unittest.main()
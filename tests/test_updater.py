@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# tests of the EPUBCheck updater against a local stand-in for GitHub
+
+# standard libraries
+import io, os, sys, json, shutil, hashlib, zipfile, tempfile, threading, unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import updater
+from updater import fetch_latest_release, download, download_and_install, install, UpdateError
+
+ETAG = '"releases-1"'
+
+def make_release_zip(version):
+    # an EPUBCheck release: epubcheck.jar and lib/ in a versioned folder
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        archive.writestr('epubcheck-{}/epubcheck.jar'.format(version), 'epubcheck.jar {}'.format(version) * 200)
+        archive.writestr('epubcheck-{}/lib/jing.jar'.format(version), 'jing.jar {}'.format(version) * 200)
+    return data.getvalue()
+
+class ReleaseServer(object):
+    '''
+    Serves a GitHub style releases list with an ETag and a release zip file that supports range requests.
+    '''
+
+    def __init__(self, zip_data):
+        self.zip_data = zip_data
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if self.path == '/releases':
+                    if self.headers.get('If-None-Match') == ETAG:
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                    body = json.dumps(server.releases()).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('ETag', ETAG)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif self.path == '/epubcheck.zip':
+                    data = server.zip_data
+                    byte_range = self.headers.get('Range')
+                    if byte_range:
+                        start = int(byte_range.partition('=')[2].rstrip('-'))
+                        self.send_response(206)
+                        self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(data) - 1, len(data)))
+                        data = data[start:]
+                    else:
+                        self.send_response(200)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self.send_error(404)
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def releases(self):
+        return [
+            {'tag_name': 'v6.0.0-beta', 'prerelease': True, 'assets': []},
+            {'tag_name': 'v5.1.0', 'assets': [{'name': 'epubcheck-5.1.0.zip', 'browser_download_url': self.url + '/epubcheck.zip',
+                                               'size': len(self.zip_data), 'digest': self.digest()}]},
+        ]
+
+    def digest(self):
+        return 'sha256:' + hashlib.sha256(self.zip_data).hexdigest()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class UpdaterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ReleaseServer(make_release_zip('5.1.0'))
+        self.epubcheck_dir = tempfile.mkdtemp()
+
+        # the installed version
+        with open(os.path.join(self.epubcheck_dir, 'epubcheck.jar'), 'w') as f:
+            f.write('epubcheck.jar 5.0.0')
+        os.mkdir(os.path.join(self.epubcheck_dir, 'lib'))
+        with open(os.path.join(self.epubcheck_dir, 'lib', 'jing.jar'), 'w') as f:
+            f.write('jing.jar 5.0.0')
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.epubcheck_dir, ignore_errors=True)
+
+    def read(self, *names):
+        with open(os.path.join(self.epubcheck_dir, *names), 'r') as f:
+            return f.read()
+
+    def release(self):
+        return fetch_latest_release({}, self.server.url + '/releases')
+
+    def test_latest_release(self):
+        release = self.release()
+        self.assertEqual(release['latest_version'], 'v5.1.0')
+        self.assertEqual(release['download_url'], self.server.url + '/epubcheck.zip')
+        self.assertEqual(release['etag'], ETAG)
+
+    def test_not_modified(self):
+        # the cached release is returned if the releases list didn't change
+        cache = self.release()
+        cache['latest_version'] = 'cached'
+        self.assertEqual(fetch_latest_release(cache, self.server.url + '/releases')['latest_version'], 'cached')
+        path, headers = self.server.requests[-1]
+        self.assertEqual(headers.get('If-None-Match'), ETAG)
+
+    def test_no_server(self):
+        url = self.server.url + '/releases'
+        self.server.close()
+        with self.assertRaises(UpdateError):
+            fetch_latest_release({}, url, timeout=2)
+
+    def test_resume_download(self):
+        dest = os.path.join(self.epubcheck_dir, 'epubcheck.zip')
+        with open(dest + '.part', 'wb') as f:
+            f.write(self.server.zip_data[:100])
+        download(self.server.url + '/epubcheck.zip', dest, len(self.server.zip_data))
+        path, headers = self.server.requests[-1]
+        self.assertEqual(headers.get('Range'), 'bytes=100-')
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), self.server.zip_data)
+        self.assertFalse(os.path.exists(dest + '.part'))
+
+    def test_install(self):
+        download_and_install(self.release(), self.epubcheck_dir)
+        self.assertTrue(self.read('epubcheck.jar').startswith('epubcheck.jar 5.1.0'))
+        self.assertTrue(self.read('lib', 'jing.jar').startswith('jing.jar 5.1.0'))
+        self.assertEqual(os.listdir(os.path.join(self.epubcheck_dir, 'downloads')), [])
+
+    def test_digest_mismatch(self):
+        # the corrupted download is removed, the installed version is kept
+        release = self.release()
+        release['digest'] = 'sha256:' + '0' * 64
+        with self.assertRaises(UpdateError):
+            download_and_install(release, self.epubcheck_dir)
+        self.assertEqual(self.read('epubcheck.jar'), 'epubcheck.jar 5.0.0')
+        self.assertEqual(self.read('lib', 'jing.jar'), 'jing.jar 5.0.0')
+        self.assertEqual(os.listdir(os.path.join(self.epubcheck_dir, 'downloads')), [])
+
+    def test_rollback(self):
+        # moving the new epubcheck.jar in fails after lib/ was replaced
+        zip_path = os.path.join(self.epubcheck_dir, 'epubcheck.zip')
+        with open(zip_path, 'wb') as f:
+            f.write(self.server.zip_data)
+        rename = os.rename
+        def failing_rename(src, dst):
+            if src.endswith(os.path.join('epubcheck-5.1.0', 'epubcheck.jar')):
+                raise OSError('file in use')
+            rename(src, dst)
+        with mock.patch.object(updater.os, 'rename', side_effect=failing_rename):
+            with self.assertRaises(UpdateError):
+                install(zip_path, self.epubcheck_dir)
+        self.assertEqual(self.read('epubcheck.jar'), 'epubcheck.jar 5.0.0')
+        self.assertEqual(self.read('lib', 'jing.jar'), 'jing.jar 5.0.0')
+        self.assertEqual(sorted(os.listdir(self.epubcheck_dir)), ['epubcheck.jar', 'epubcheck.zip', 'lib'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# lightweight timing spans and counters of a check
+
+# standard libraries
+import os, json, time, functools, threading
+from contextlib import contextmanager
+
+# the timings of the running check in each thread; functions decorated with @timed record their spans in them,
+# so that other threads (e.g. the update check) don't add their spans to the check
+_local = threading.local()
+
+class Timings(object):
+    '''
+    Timing spans and counters of a single check. Spans with the same name are added up;
+    spans may be nested, e.g. jarWrapper inside get_java_info.
+    '''
+
+    def __init__(self):
+        self.start = time.time()
+        self.end = None
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start)
+
+    def add(self, name, seconds):
+        with self.lock:
+            for span in self.spans:
+                if span[0] == name:
+                    span[1] += seconds
+                    span[2] += 1
+                    return
+            self.spans.append([name, seconds, 1])
+
+    def count(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    def stop(self):
+        if self.end is None:
+            self.end = time.time()
+
+    def total(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'date': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start)),
+                'total': round(self.total(), 4),
+                'spans': dict((name, {'seconds': round(seconds, 4), 'calls': calls}) for name, seconds, calls in self.spans),
+                'counters': dict(self.counters),
+            }
+
+    def summary(self):
+        ''' One line per span and counter, for the dock '''
+        lines = []
+        with self.lock:
+            for name, seconds, calls in self.spans:
+                lines.append('{:<24}{:>9.3f} s{}'.format(name, seconds, ' ({}×)'.format(calls) if calls > 1 else ''))
+            lines.append('{:<24}{:>9.3f} s'.format('total', self.total()))
+            for name, value in sorted(self.counters.items()):
+                if name.endswith('_bytes'):
+                    lines.append('{:<24}{:>9.1f} MB'.format(name[:-6], value / 1024.0 / 1024.0))
+                else:
+                    lines.append('{:<24}{:>9}'.format(name, '{:,}'.format(value) if isinstance(value, int) else value))
+        return '\n'.join(lines)
+
+# record the spans of the @timed functions of the current thread in timings; None stops recording
+def set_active(timings):
+    _local.timings = timings
+
+def get_active():
+    return getattr(_local, 'timings', None)
+
+# decorator: record the run time of a function in the active timings
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = get_active()
+            if timings is None:
+                return func(*args, **kwargs)
+            with timings.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# append a record to a JSON lines log file; the file is rotated when it gets too big
+def append_log(log_path, record, max_size=1024 * 1024, backups=3):
+    try:
+        if os.path.exists(log_path) and os.path.getsize(log_path) > max_size:
+            for i in range(backups - 1, 0, -1):
+                if os.path.exists('{}.{}'.format(log_path, i)):
+                    os.replace('{}.{}'.format(log_path, i), '{}.{}'.format(log_path, i + 1))
+            os.replace(log_path, log_path + '.1')
+        with open(log_path, 'ab') as f:
+            f.write(json.dumps(record).encode('utf-8') + b'\n')
+    except OSError as e:
+        print('Timing log not written:', e)
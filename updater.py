@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+# EPUBCheck release check, download and installation
+
+# standard libraries
+import os, sys, json, socket, shutil, hashlib, zipfile, tempfile
+
+# make sure the plugin will work with the Python 3 version of Calibre
+if sys.version_info[0] == 2:
+    from urllib2 import urlopen, Request, HTTPError, URLError
+else:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError, URLError
+
+GITHUB_URL = 'https://api.github.com/repos/w3c/epubcheck/releases'
+USER_AGENT = 'calibre-epubcheck-plugin'
+
+class UpdateError(Exception):
+    pass
+
+# get the latest stable release with a .zip file
+def latest_release(releases):
+    for release in releases:
+        tag_name = release.get('tag_name', '')
+        if release.get('draft') or release.get('prerelease') or 'alpha' in tag_name or 'beta' in tag_name:
+            continue
+        for asset in release.get('assets', []):
+            if asset.get('name', '').endswith('.zip'):
+                return {
+                    'latest_version': tag_name,
+                    'download_url': asset['browser_download_url'],
+                    'size': asset.get('size'),
+                    'digest': asset.get('digest'),
+                }
+    return None
+
+# get the latest release; the releases list is only downloaded again if it changed (ETag/Last-Modified)
+def fetch_latest_release(cache, github_url=GITHUB_URL, timeout=10):
+    request = Request(github_url, headers={'User-Agent': USER_AGENT, 'Accept': 'application/vnd.github+json'})
+    if cache.get('etag'):
+        request.add_header('If-None-Match', cache['etag'])
+    if cache.get('last_modified'):
+        request.add_header('If-Modified-Since', cache['last_modified'])
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        if e.code == 304 and cache.get('latest_version'):
+            return cache
+        raise UpdateError('Update check failed: HTTP error {}'.format(e.code))
+    except (URLError, socket.timeout, OSError) as e:
+        raise UpdateError('Update check skipped: no Internet ({})'.format(e))
+    try:
+        releases = json.loads(response.read().decode('utf-8'))
+    except ValueError:
+        raise UpdateError('Update check failed: invalid release information')
+    finally:
+        response.close()
+
+    release = latest_release(releases)
+    if release is None:
+        raise UpdateError('Update check failed: no EPUBCheck release found')
+    release['etag'] = response.headers.get('ETag')
+    release['last_modified'] = response.headers.get('Last-Modified')
+    return release
+
+# download a file; partial downloads are continued
+def download(url, dest, size=None, timeout=30, cancelled=None):
+    part_path = dest + '.part'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if size is not None and offset > size:
+        os.remove(part_path)
+        offset = 0
+    request = Request(url, headers={'User-Agent': USER_AGENT})
+    if offset:
+        request.add_header('Range', 'bytes={}-'.format(offset))
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        # the partial file is already complete
+        if e.code == 416 and offset and offset == size:
+            os.replace(part_path, dest)
+            return dest
+        raise UpdateError('Download failed: HTTP error {}'.format(e.code))
+    except (URLError, socket.timeout, OSError) as e:
+        raise UpdateError('Download failed: {}'.format(e))
+
+    # the server ignored the range request
+    if offset and response.getcode() != 206:
+        offset = 0
+    try:
+        with open(part_path, 'ab' if offset else 'wb') as f:
+            while True:
+                if cancelled is not None and cancelled():
+                    raise UpdateError('Download cancelled')
+                chunk = response.read(64 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+    except (socket.timeout, OSError) as e:
+        raise UpdateError('Download interrupted: {}'.format(e))
+    finally:
+        response.close()
+
+    if size is not None and os.path.getsize(part_path) != size:
+        raise UpdateError('Download incomplete: {} of {} bytes'.format(os.path.getsize(part_path), size))
+    os.replace(part_path, dest)
+    return dest
+
+# verify the downloaded file against the release digest (e.g. sha256:...)
+def verify(path, digest=None):
+    if digest:
+        algorithm, sep, expected = digest.partition(':')
+        if sep and algorithm in hashlib.algorithms_available:
+            h = hashlib.new(algorithm)
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(block)
+            if h.hexdigest().lower() != expected.lower():
+                os.remove(path)
+                raise UpdateError('Download corrupted: {} checksum mismatch'.format(algorithm))
+    try:
+        with zipfile.ZipFile(path) as archive:
+            if archive.testzip() is not None:
+                raise zipfile.BadZipfile('CRC error')
+    except zipfile.BadZipfile as e:
+        os.remove(path)
+        raise UpdateError('Download corrupted: {}'.format(e))
+
+# replace epubcheck.jar and lib/ with the files from the release zip file
+def install(zip_path, epubcheck_dir):
+    epc_path = os.path.join(epubcheck_dir, 'epubcheck.jar')
+    epc_lib_dir = os.path.join(epubcheck_dir, 'lib')
+
+    # the staging folder is on the same file system, so that the files can be renamed
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=epubcheck_dir)
+    try:
+        # read zip file
+        # https://stackoverflow.com/questions/19618268/extract-and-rename-zip-file-folder
+        with zipfile.ZipFile(zip_path) as archive:
+            files = archive.namelist()
+            jar_names = [m for m in files if m.count('/') == 1 and m.endswith('/epubcheck.jar')]
+            if not jar_names:
+                raise UpdateError("EPUBCheck update failed. The EPUBCheck .zip file couldn't be unpacked.")
+            root_path = jar_names[0].split('/')[0]
+            files_to_extract = [m for m in files if (m.startswith(root_path + '/lib/') or m == root_path + '/epubcheck.jar')]
+            archive.extractall(staging_dir, files_to_extract)
+
+        # temp paths to epubcheck.jar and the /lib folder
+        new_epc_path = os.path.join(staging_dir, root_path, 'epubcheck.jar')
+        new_epc_lib_dir = os.path.join(staging_dir, root_path, 'lib')
+        if not os.path.isdir(new_epc_lib_dir) or not os.path.isfile(new_epc_path):
+            raise UpdateError("EPUBCheck update failed. The EPUBCheck .zip file couldn't be unpacked.")
+
+        # ensure you have execute rights for unix based platforms
+        if not sys.platform.startswith('win'):
+            os.chmod(new_epc_path, 0o744)
+
+        # move the current files out of the way, then move the new files in
+        old_dir = os.path.join(staging_dir, 'old')
+        os.mkdir(old_dir)
+        moved = []
+        try:
+            for current, new in ((epc_lib_dir, new_epc_lib_dir), (epc_path, new_epc_path)):
+                old = os.path.join(old_dir, os.path.basename(current))
+                if os.path.exists(current):
+                    os.rename(current, old)
+                    moved.append((current, old))
+                os.rename(new, current)
+        except OSError as e:
+            # restore the previous version
+            for current, old in moved:
+                if os.path.isdir(current):
+                    shutil.rmtree(current, ignore_errors=True)
+                elif os.path.exists(current):
+                    os.remove(current)
+                os.rename(old, current)
+            raise UpdateError('EPUBCheck update failed: {}'.format(e))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+# download, verify and install a release
+def download_and_install(release, epubcheck_dir, before_install=None, cancelled=None):
+    download_dir = os.path.join(epubcheck_dir, 'downloads')
+    if not os.path.isdir(download_dir):
+        os.makedirs(download_dir)
+    zip_path = os.path.join(download_dir, os.path.basename(release['download_url']))
+    download(release['download_url'], zip_path, release.get('size'), cancelled=cancelled)
+    verify(zip_path, release.get('digest'))
+    if before_install is not None:
+        before_install()
+    install(zip_path, epubcheck_dir)
+    os.remove(zip_path)
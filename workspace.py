@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+from __future__ import (unicode_literals, division, absolute_import,
+                        print_function)
+
+__license__ = 'GPL v3'
+__copyright__ = '2023 Doitsu'
+
+'''
+Persistent scratch folders for the checked books. Each book keeps an epub copy in its
+workspace that is updated in place: unchanged zip entries stay where they are, changed
+entries are moved to the end of the archive, so repeated checks only rewrite the tail
+of the file. The workspaces are kept in memory (/dev/shm) when there's enough space;
+they are removed when calibre quits then, the workspaces on disk are kept.
+'''
+
+# standard libraries
+import os, json, time, atexit, shutil, hashlib, zipfile, tempfile, unicodedata
+
+# the RAM disk of most Linux systems
+SHM_DIR = '/dev/shm'
+
+# file names in the scratch folder
+EPUB_NAME = 'temp.epub'
+STATE_NAME = 'entries.json'
+
+# prefix of the folders of single checks
+RUN_PREFIX = 'epubcheck-run-'
+
+# files that calibre doesn't put into an epub; the mimetype entry is always written by the workspace,
+# since the unpacked books of calibre don't always have the file
+EXCLUDED_FILES = {'.DS_Store', 'mimetype', 'iTunesMetadata.plist'}
+
+# get the folder of the workspaces; the RAM disk is used if it can hold twice the book
+def scratch_root(scratch_dir=None, needed_bytes=0):
+    folder_name = 'calibre-epubcheck-{}'.format(os.getuid()) if hasattr(os, 'getuid') else 'calibre-epubcheck'
+    candidates = [scratch_dir] if scratch_dir else [SHM_DIR]
+    for base_dir in candidates:
+        if not os.path.isdir(base_dir) or not os.access(base_dir, os.W_OK):
+            continue
+        try:
+            if shutil.disk_usage(base_dir).free < 2 * needed_bytes:
+                continue
+        except OSError:
+            continue
+        return os.path.join(base_dir, folder_name)
+    return os.path.join(tempfile.gettempdir(), folder_name)
+
+# the workspaces on the RAM disk that were opened by this process
+_memory_workspaces = set()
+
+# free the RAM disk when calibre quits; the workspaces of other calibre processes are kept
+def remove_memory_workspaces():
+    for path in _memory_workspaces:
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+    _memory_workspaces.clear()
+
+atexit.register(remove_memory_workspaces)
+
+# remove the workspaces that weren't used for max_age days, and the oldest ones beyond max_books
+def cleanup_workspaces(root, max_books=3, max_age=7, current=None):
+    try:
+        folders = [os.path.join(root, name) for name in os.listdir(root)]
+    except OSError:
+        return
+    folders = sorted((folder for folder in folders if os.path.isdir(folder) and folder != current),
+                     key=os.path.getmtime, reverse=True)
+    now = time.time()
+    kept = 1 if current is not None else 0
+    for folder in folders:
+        if kept < max_books and now - os.path.getmtime(folder) < max_age * 86400:
+            kept += 1
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+# remove the folders of checks that didn't clean up after themselves, e.g. after a crash
+def cleanup_runs(max_age=86400):
+    temp_dir = tempfile.gettempdir()
+    now = time.time()
+    try:
+        names = [name for name in os.listdir(temp_dir) if name.startswith(RUN_PREFIX)]
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(temp_dir, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+# get the zip entry names of the files of an unpacked book and their size, mtime and inode
+def book_entries(book_root):
+    entries = {}
+    for root, dirs, files in os.walk(book_root):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            if file_name in EXCLUDED_FILES:
+                continue
+            name = unicodedata.normalize('NFC', os.path.relpath(path, book_root).replace(os.sep, '/'))
+            stat = os.stat(path)
+            entries[name] = (path, [stat.st_size, stat.st_mtime_ns, stat.st_ino])
+    return entries
+
+class Workspace(object):
+    '''
+    The scratch folder of a book, identified by the path of the book.
+    '''
+
+    def __init__(self, root, book_key):
+        self.root = root
+        self.path = os.path.join(root, hashlib.sha1(book_key.encode('utf-8')).hexdigest()[:16])
+        self.epub_path = os.path.join(self.path, EPUB_NAME)
+        self.state_path = os.path.join(self.path, STATE_NAME)
+
+    def open(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, mode=0o700)
+        # the modification time of the folder is used to find unused workspaces
+        os.utime(self.path, None)
+        if os.path.dirname(self.root) == SHM_DIR:
+            _memory_workspaces.add(self.path)
+        return self
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, IOError, ValueError):
+            return None
+
+    def save_state(self, entries):
+        state_path = self.state_path + '.tmp'
+        with open(state_path, 'w') as f:
+            json.dump(dict((name, stamp) for name, (path, stamp) in entries.items()), f)
+        os.replace(state_path, self.state_path)
+
+    def sync(self, book_root):
+        ''' Updates the epub copy from an unpacked book; returns the names of the rewritten entries '''
+        entries = book_entries(book_root)
+        state = self.load_state()
+
+        # the state is removed while the epub is modified, so an interrupted update is detected on the next run
+        if state is not None:
+            os.remove(self.state_path)
+        written = None
+        if state is not None and zipfile.is_zipfile(self.epub_path):
+            try:
+                written = self.update(entries, state)
+            except (zipfile.BadZipfile, OSError, ValueError) as e:
+                print('EPUBCheck workspace rebuilt:', e)
+        if written is None:
+            written = self.write_all(entries)
+        self.save_state(entries)
+        return written
+
+    def write_all(self, entries):
+        names = sorted(entries)
+        with zipfile.ZipFile(self.epub_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('mimetype', b'application/epub+zip', zipfile.ZIP_STORED)
+            for name in names:
+                archive.write(entries[name][0], name)
+        return ['mimetype'] + names
+
+    def update(self, entries, state):
+        # returns None if the epub has to be written again
+        with zipfile.ZipFile(self.epub_path, 'a', zipfile.ZIP_DEFLATED) as archive:
+            infos = sorted(archive.infolist(), key=lambda info: info.header_offset)
+            if not infos or infos[0].filename != 'mimetype':
+                return None
+
+            # the mimetype entry never changes, so the cut is always after it
+            names = set(info.filename for info in infos[1:])
+            changed = set(name for name, (path, stamp) in entries.items() if name not in names or state.get(name) != stamp)
+            removed = names - set(entries)
+            if not changed and not removed:
+                return []
+
+            # everything from the first changed entry on is rewritten; the changed files go to the end
+            # of the archive, so that the next changes of the same files only rewrite the tail
+            cut = min([info.header_offset for info in infos if info.filename in changed or info.filename in removed] or [archive.start_dir])
+            kept = [info for info in infos if info.header_offset < cut]
+            moved = [info.filename for info in infos if info.header_offset >= cut and info.filename in entries and info.filename not in changed]
+            written = moved + sorted(changed)
+            archive.filelist = kept
+            archive.NameToInfo = dict((info.filename, info) for info in kept)
+            archive.start_dir = cut
+            archive._didModify = True
+            for name in written:
+                archive.write(entries[name][0], name)
+        return written